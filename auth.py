@@ -0,0 +1,73 @@
+import hashlib
+import json
+import os
+import time
+from config import *
+
+# 25Live session cookie, written by `get-cookie` (see get_cookie.py)
+COOKIE_FILE = "cookie.dat"
+
+# The last successful check_cookie(), so that commands run shortly after each other don't check again
+COOKIE_CHECK_FILE = "cookie.checked"
+
+# Can be pointed at a stand-in server, see bench/
+BASE_URL_25LIVE = os.environ.get("CMUROOM_25LIVE_URL", "https://25live.collegenet.com/25live/data/cmu/run")
+
+LOGIN_URL_25LIVE = "/login.json?caller=pro"
+
+def read_cookie(cookie_file=COOKIE_FILE):
+    """The saved session cookie, or None if there is none"""
+    try:
+        with open(cookie_file, "r") as f:
+            cookie = f.read().strip()
+    except OSError:
+        return None
+
+    return cookie if len(cookie) > 0 else None
+
+def _fingerprint(cookie):
+    return hashlib.sha1(cookie.encode()).hexdigest()
+
+def check_cookie(cookie, max_age=COOKIE_CHECK_TTL):
+    """
+    Returns the 25Live username the session cookie is logged in as, or None if it is not logged in.
+    A successful check is trusted for `max_age` seconds; otherwise this is a single login.json request
+    with a short timeout and no retries. Raises requests.RequestException if 25Live can't be reached.
+    """
+    import requests
+
+    try:
+        with open(COOKIE_CHECK_FILE, "r") as f:
+            checked = json.load(f)
+        if checked["cookie"] == _fingerprint(cookie) and time.time() - checked["time"] < max_age:
+            return checked["username"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    response = requests.get(BASE_URL_25LIVE + LOGIN_URL_25LIVE, cookies={"WSSESSIONID": cookie},
+                            timeout=COOKIE_CHECK_TIMEOUT)
+
+    username = None
+    if response.text.startswith(")]}',\n"):
+        try:
+            username = json.loads(response.text[len(")]}',\n"):])["login_response"]["login"]["username"]
+        except (ValueError, KeyError, TypeError):
+            pass
+
+    if username is None:
+        forget_cookie_check()
+        return None
+
+    tmp_path = f"{COOKIE_CHECK_FILE}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"cookie": _fingerprint(cookie), "username": username, "time": time.time()}, f)
+    os.replace(tmp_path, COOKIE_CHECK_FILE)
+
+    return username
+
+def forget_cookie_check():
+    """Makes the next check_cookie() ask 25Live again, e.g. after a request was refused"""
+    try:
+        os.remove(COOKIE_CHECK_FILE)
+    except OSError:
+        pass
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Checks the optimized algorithms against straightforward reference versions on random inputs.
+
+    python3 bench/check.py [--seed N] [--rounds N]
+
+Exits with status 1 if any check fails.
+"""
+import argparse
+import os
+import pickle
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+BENCH_PATH = os.path.abspath(os.path.dirname(__file__))
+REPO_PATH = os.path.dirname(BENCH_PATH)
+sys.path.insert(0, REPO_PATH)
+sys.path.insert(0, BENCH_PATH)
+
+import fixtures
+import get_events
+import store
+from server import StandInServer
+
+DATE = datetime(2021, 9, 8)
+
+def reference_space_events(space, soc_timings, date, events25):
+    """
+    The original merge of SOC and 25Live events: repeatedly scan and remove from both lists. Unlike
+    the very first version it applies the tolerance symmetrically (see get_events.get_space_events).
+    """
+    midnight = datetime(date.year, date.month, date.day)
+    tolerance = get_events.MERGE_TOLERANCE_SECONDS
+
+    events25 = list(get_events._events25_for_day(events25, date))
+    events_soc = list(soc_timings[date.isoweekday() % 7].get(space["location"], []))
+
+    def seconds25(x):
+        return (x["start"] - midnight).total_seconds(), (x["end"] - midnight).total_seconds()
+
+    def close(a, b):
+        return abs(a[0] - b[0]) <= tolerance and abs(a[1] - b[1]) <= tolerance
+
+    def remove(items, matches):
+        for x in matches:
+            items[:] = [y for y in items if y is not x]
+
+    events = []
+    for event_soc in events_soc[:]:
+        if not any(x is event_soc for x in events_soc):
+            continue
+
+        times = (event_soc["start_seconds"], event_soc["end_seconds"])
+
+        e25 = [x for x in events25 if close(seconds25(x), times)]
+        remove(events25, e25)
+
+        repeats = [x for x in events_soc if close((x["start_seconds"], x["end_seconds"]), times)]
+        remove(events_soc, repeats)
+
+        events.append(get_events._create_event(event_soc, e25[0] if len(e25) > 0 else None, date))
+
+    for event in events25[:]:
+        if not any(x is event for x in events25):
+            continue
+
+        repeats = [x for x in events25 if close(seconds25(x), seconds25(event))]
+        remove(events25, repeats)
+
+        events.append(get_events._create_event(None, event, date))
+
+    return events
+
+def _random_times(rnd):
+    # A few meeting times with jitter around the merge tolerance, so that near misses are common
+    start = rnd.choice([9, 14]) * 3600 + rnd.choice([0, 600])
+    start += rnd.choice([-360, -300, -240, -60, 0, 0, 0, 60, 240, 300, 360])
+    end = start + rnd.choice([50, 80]) * 60 + rnd.choice([-360, -300, 0, 0, 300, 360])
+    return start, end
+
+def check_merge(rnd, rounds):
+    """get_space_events against reference_space_events on random rooms"""
+    failures = []
+    midnight = datetime(DATE.year, DATE.month, DATE.day)
+    day = DATE.isoweekday() % 7
+
+    for i in range(rounds):
+        space = {"location": "XX 100", "25live_id": 1}
+
+        events_soc = []
+        for j in range(rnd.randint(0, 8)):
+            start, end = _random_times(rnd)
+            events_soc.append({"start_seconds": start, "end_seconds": end, "number": f"15-{j:03d}",
+                               "name": f"Course {j}", "instructors": [f"Instructor {j}"]})
+
+        events25 = []
+        for j in range(rnd.randint(0, 8)):
+            start, end = _random_times(rnd)
+            # Some reservations fall on other days of the downloaded range
+            offset = timedelta(days=rnd.choice([0, 0, 0, 1, -1]))
+            events25.append({"start": midnight + offset + timedelta(seconds=start), "end": midnight + offset + timedelta(seconds=end),
+                             "name": f"{j} Reservation", "title": f"Event {j}", "course_name": rnd.choice([None, "", f"Course {j}"]),
+                             "state": rnd.choice(["Confirmed", "Tentative", ""]), "comment": ""})
+
+        soc_timings = [{} for _ in range(7)]
+        soc_timings[day][space["location"]] = events_soc
+
+        expected = reference_space_events(space, soc_timings, DATE, events25)
+        actual = get_events.get_space_events(space, soc_timings, DATE, events25=events25)
+        if actual != expected:
+            failures.append(f"merge round {i}: expected {expected}, got {actual}")
+
+    return failures
+
+def reference_free_intervals(busy):
+    """[(start, end), ...] of the free stretches of a day given the set of busy minutes"""
+    out = []
+    minute = 0
+    while minute < store.MINUTES_PER_DAY:
+        if minute in busy:
+            minute += 1
+            continue
+        end = minute
+        while end < store.MINUTES_PER_DAY and end not in busy:
+            end += 1
+        out.append((minute, end))
+        minute = end
+    return out
+
+def check_intervals(rnd, rounds):
+    """The occupancy bitmap and free interval helpers in store against minute-by-minute versions"""
+    failures = []
+
+    for i in range(rounds):
+        rows = []
+        for _ in range(rnd.randint(0, 6)):
+            # Including events that start before or end after the day, and empty ones
+            start = rnd.randint(-60, store.MINUTES_PER_DAY + 60)
+            rows.append((start, start + rnd.choice([0, 1, 2, 50, 80, 300, 1500])))
+
+        busy = set(m for start, end in rows for m in range(max(0, start), min(store.MINUTES_PER_DAY, end)))
+        bits = store.rows_to_bitmap(rows)
+        if bits != sum(1 << m for m in busy):
+            failures.append(f"rows_to_bitmap round {i}: {rows}")
+            continue
+
+        expected = reference_free_intervals(busy)
+        intervals = store.free_intervals(bits)
+        if list(zip(intervals[::2], intervals[1::2])) != expected:
+            failures.append(f"free_intervals round {i}: expected {expected}, got {list(intervals)}")
+            continue
+
+        for minute in [0, store.MINUTES_PER_DAY - 1] + [rnd.randrange(store.MINUTES_PER_DAY) for _ in range(20)]:
+            containing = [x for x in expected if x[0] <= minute < x[1]]
+            following = [x for x in expected if x[1] > minute]
+
+            if minute not in busy and store.free_interval(bits, minute) != containing[0]:
+                failures.append(f"free_interval round {i} minute {minute}: {rows}")
+            if store.find_free_interval(intervals, minute) != (containing[0] if len(containing) > 0 else None):
+                failures.append(f"find_free_interval round {i} minute {minute}: {rows}")
+            if store.next_free_interval(intervals, minute) != (following[0] if len(following) > 0 else
+                                                               (store.MINUTES_PER_DAY, store.MINUTES_PER_DAY)):
+                failures.append(f"next_free_interval round {i} minute {minute}: {rows}")
+
+            end = rnd.randint(minute, store.MINUTES_PER_DAY)
+            if store.range_mask(minute, end) != sum(1 << m for m in range(minute, end)):
+                failures.append(f"range_mask({minute}, {end})")
+
+    return failures
+
+def _stored_events(path):
+    conn = sqlite3.connect(path)
+    out = sorted(conn.execute("SELECT date, location, start, end, name, status, source, comment FROM events"))
+    conn.close()
+    return out
+
+def check_checkpoint(rnd, rounds):
+    """
+    Update checkpoints cut off at random points resume with exactly the complete records, and an
+    update interrupted twice and resumed stores the same events as one that ran straight through
+    """
+    failures = []
+    path = tempfile.mkdtemp(prefix="cmuroom-check-")
+    cwd = os.getcwd()
+    try:
+        os.chdir(path)
+
+        header = {"dates": ["2021-09-08"], "incremental": False}
+        records = [(f"XX {i}", {"2021-09-08": ("fingerprint", [(i, i + 50, "Event", "Confirmed", "25Live", "")])}) for i in range(20)]
+        with open(get_events.UPDATE_CHECKPOINT, "wb") as f:
+            pickle.dump(dict(header, spaces=[]), f)
+            offsets = [f.tell()]
+            for x in records:
+                pickle.dump(x, f)
+                offsets.append(f.tell())
+        with open(get_events.UPDATE_CHECKPOINT, "rb") as f:
+            data = f.read()
+
+        for i in range(min(rounds, 200)):
+            cut = rnd.randint(offsets[0], len(data))
+            with open(get_events.UPDATE_CHECKPOINT, "wb") as f:
+                f.write(data[:cut])
+
+            f, spaces, completed = get_events._open_checkpoint(header)
+            complete = sum(1 for x in offsets[1:] if x <= cut)
+            if spaces != [] or completed != set(x[0] for x in records[:complete]) or f.tell() != offsets[complete]:
+                failures.append(f"checkpoint cut at {cut}: resumed with {sorted(completed)} at {f.tell()}")
+
+            # Appending after the resumed records leaves a readable file
+            pickle.dump(records[complete] if complete < len(records) else records[0], f)
+            f.close()
+            with open(get_events.UPDATE_CHECKPOINT, "rb") as f:
+                if len(list(get_events._checkpoint_records(f))) != complete + 2:
+                    failures.append(f"checkpoint cut at {cut}: unreadable after appending")
+
+        f, spaces, completed = get_events._open_checkpoint(dict(header, dates=["2021-09-09"]))
+        f.close()
+        if spaces is not None or len(completed) > 0:
+            failures.append("checkpoint of other dates was resumed")
+
+        os.remove(get_events.UPDATE_CHECKPOINT)
+
+        # End to end, against the stand-in server with a small synthetic campus
+        fixtures.BASE_CLASSROOMS, fixtures.BASE_OTHER_SPACES, fixtures.BASE_COURSES = 60, 30, 300
+        fixtures.generate(path, days=3, seed=rnd.randrange(1000))
+        with open("cookie.dat", "w") as f:
+            f.write("check")
+
+        get_events.RATE_LIMITER = get_events.RateLimiter(0)
+        start, end = datetime(2021, 9, 6), datetime(2021, 9, 8)
+
+        with StandInServer(path) as server:
+            get_events.BASE_URL_25LIVE = get_events.auth.BASE_URL_25LIVE = server.url
+            get_events.run_update(start, end, processes=1)
+            expected = _stored_events(store.EVENTS_DB)
+            os.remove(store.EVENTS_DB)
+
+            # Each run counts only the spaces it did itself
+            for stop_after in [rnd.randint(1, 30), rnd.randint(1, 30)]:
+                def progress(stage, done, total):
+                    if done == stop_after:
+                        raise KeyboardInterrupt()
+                try:
+                    get_events.run_update(start, end, processes=1, progress=progress)
+                    failures.append("update was not interrupted")
+                except get_events.UpdateError:
+                    pass
+
+                if os.path.exists(store.EVENTS_DB) and len(_stored_events(store.EVENTS_DB)) > 0:
+                    failures.append(f"events published by an update interrupted after {stop_after} spaces")
+
+            get_events.run_update(start, end, processes=1)
+            if _stored_events(store.EVENTS_DB) != expected:
+                failures.append("resumed update stored different events than an uninterrupted one")
+            if os.path.exists(get_events.UPDATE_CHECKPOINT):
+                failures.append("checkpoint left behind by a finished update")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(path, ignore_errors=True)
+
+    return failures
+
+CHECKS = [check_merge, check_intervals, check_checkpoint]
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the optimized algorithms against reference versions")
+    parser.add_argument("--seed", type=int, default=0, help="random seed (default 0)")
+    parser.add_argument("--rounds", type=int, default=2000, help="random inputs per check (default 2000)")
+    args = parser.parse_args()
+
+    failures = []
+    for check in CHECKS:
+        found = check(random.Random(args.seed), args.rounds)
+        print(f"{check.__name__}: {'ok' if len(found) == 0 else f'{len(found)} failures'}")
+        failures += found
+
+    for x in failures[:10]:
+        print(x)
+
+    if len(failures) > 0:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import csv
+import json
+import os
+import random
+from datetime import datetime, timedelta
+
+# A fixture directory holds everything an update reads, so that it can run without 25Live access:
+#   login.json, listdata.json       - 25Live responses, without the ")]}'," prefix
+#   reservations/<space_id>.json    - list of space_reservation entries for the space
+#   courses-f21.txt                 - SOC file
+#   registrar-classrooms-f21.csv    - registrar classroom list
+# record.py captures the 25Live part from the live site; generate() synthesizes all of it.
+
+BUILDINGS = ["ANS", "BH", "CFA", "CIC", "CYH", "DH", "GHC", "HBH", "HH", "HL", "HOA", "MI", "MM", "NSH",
+             "PCA", "PH", "POS", "REH", "TCS", "TEP", "WEH", "WW"]
+
+REGISTRAR_TYPES = ["CLASSROOM", "CLASSROOM", "CLASSROOM", "LEARNING HALL", "AUDITORIUM", "COMPUTER LAB",
+                   "LAB", "SPECIALTY SHOP", "STUDIO (STATIC)"]
+
+# Roughly the size of the Pittsburgh campus in Fall 2021
+BASE_CLASSROOMS = 300
+BASE_OTHER_SPACES = 150
+BASE_COURSES = 3000
+
+MEETING_TIMES = [(8, 0, 80), (9, 30, 80), (11, 0, 80), (12, 30, 80), (14, 0, 80), (15, 30, 80),
+                 (17, 0, 80), (18, 30, 80), (10, 0, 50), (13, 0, 50), (16, 0, 50), (19, 0, 170)]
+MEETING_DAYS = [[1, 3], [2, 4], [1, 3, 5], [5], [1], [3]]
+
+def _time_str(hour, minute):
+    return datetime(2000, 1, 1, hour, minute).strftime("%I:%M%p")
+
+def _rm_datetime(date, hour, minute):
+    return datetime(date.year, date.month, date.day, hour, minute).strftime("%Y-%m-%dT%H:%M:%S-04:00")
+
+def generate(path, scale=1, start_date=datetime(2021, 9, 6), days=7, seed=0):
+    rnd = random.Random(seed)
+    os.makedirs(os.path.join(path, "reservations"), exist_ok=True)
+
+    # Some rooms have letters in them (e.g. BH 136A), which also keeps pandas from reading the column as numbers
+    classrooms = {("CFA", "ACH")}
+    while len(classrooms) < BASE_CLASSROOMS * scale:
+        classrooms.add((rnd.choice(BUILDINGS), str(rnd.randint(100, 9999)) + rnd.choice(["", "", "", "", "A", "B"])))
+    classrooms = sorted(classrooms)
+
+    with open(os.path.join(path, "registrar-classrooms-f21.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["building_name", "building", "room", "name", "department", "type", "capacity"])
+        for building, room in classrooms:
+            if rnd.random() < 0.8:
+                name = rnd.choice(["", "", "", "", "Lecture Hall", "Studio"])
+                writer.writerow([building, building, room, name, rnd.choice(["CFA", "SCS", "ENG", "MCS"]),
+                                 rnd.choice(REGISTRAR_TYPES), rnd.choice(["", "20", "40", "80", "150+"])])
+
+    courses = {}
+    for i in range(BASE_COURSES * scale):
+        number = f"{rnd.randint(1, 99):02d}-{i % 1000:03d}"
+        if number in courses:
+            continue
+
+        sections = []
+        for name in ["Lec", "A", "B", "A1", "A2"][:rnd.randint(1, 5)]:
+            hour, minute, length = rnd.choice(MEETING_TIMES)
+            end = datetime(2000, 1, 1, hour, minute) + timedelta(minutes=length)
+            building, room = rnd.choice(classrooms)
+            sections.append({
+                "name": name,
+                "instructors": [f"Instructor {rnd.randint(1, 2000)}"],
+                "times": [{
+                    "days": rnd.choice(MEETING_DAYS),
+                    "begin": _time_str(hour, minute),
+                    "end": _time_str(end.hour, end.minute),
+                    "building": building,
+                    "room": room,
+                    "location": "Pittsburgh, Pennsylvania"
+                }]
+            })
+
+        courses[number] = {"name": f"Course {number}", "department": "Department", "lectures": sections[:1], "sections": sections[1:]}
+
+    with open(os.path.join(path, "courses-f21.txt"), "w") as f:
+        json.dump({"courses": courses}, f)
+
+    names = [(f"{building} {room}", f"{building} {room}", "Registrar Classrooms") for building, room in classrooms]
+    names += [(f"CUC STUDY ROOM {i}", f"Cohon Center Study Room {i}", "Cohon University Center") for i in range(BASE_OTHER_SPACES * scale // 3)]
+    names += [(f"GYM {i}", f"Gymnasium {i}", "Athletics") for i in range(BASE_OTHER_SPACES * scale // 3)]
+    names += [(f"MISC SPACE {i}", f"Miscellaneous Space {i}", "") for i in range(BASE_OTHER_SPACES * scale // 3)]
+
+    rows = []
+    for i, (name, formal_name, category) in enumerate(names):
+        space_id = 1000 + i
+        capacity = rnd.choice([10, 20, 40, 80, 150])
+        rows.append({"row": [{"itemId": str(space_id), "itemName": name}, formal_name, category, "", str(capacity), str(capacity)]})
+
+        reservations = []
+        for day in range(days):
+            date = start_date + timedelta(days=day)
+            for _ in range(rnd.randint(0, 8)):
+                hour, minute, length = rnd.choice(MEETING_TIMES)
+                end = datetime(2000, 1, 1, hour, minute) + timedelta(minutes=length + rnd.choice([0, 0, 5, 10]))
+                reservations.append({
+                    "event": {
+                        "event_name": f"{rnd.randint(10000, 99999)} Reservation",
+                        "event_title": f"Event {rnd.randint(1, 10000)}",
+                        "state_name": rnd.choice(["Confirmed", "Tentative"]),
+                        "event_type_name": rnd.choice(["Class", "Meeting", "Meeting", "closed"])
+                    },
+                    "reservation_start_dt": _rm_datetime(date, hour, minute),
+                    "reservation_end_dt": _rm_datetime(date, end.hour, end.minute),
+                    "reservation_comments": ""
+                })
+
+        with open(os.path.join(path, "reservations", f"{space_id}.json"), "w") as f:
+            json.dump(reservations, f)
+
+    with open(os.path.join(path, "listdata.json"), "w") as f:
+        json.dump({"cols": [{"name": "name"}, {"name": "formal_name"}, {"name": "categories"}, {"name": "features"},
+                            {"name": "default_capacity"}, {"name": "max_capacity"}],
+                   "rows": rows}, f)
+
+    with open(os.path.join(path, "login.json"), "w") as f:
+        json.dump({"login_response": {"login": {"username": "benchmark"}}}, f)
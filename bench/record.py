@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Records a benchmark fixture (see fixtures.py) from the live 25Live site, using cookie.dat.
+
+    python3 bench/record.py OUTPUT_DIR FROM_DATE TO_DATE
+"""
+import json
+import os
+import shutil
+import sys
+
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def main():
+    if len(sys.argv) != 4:
+        print(__doc__.strip())
+        sys.exit(1)
+
+    output_path = os.path.abspath(sys.argv[1])
+    start_dt, end_dt = sys.argv[2], sys.argv[3]
+
+    sys.path.insert(0, REPO_PATH)
+    os.chdir(REPO_PATH)
+    import get_events
+    from tqdm import tqdm
+
+    os.makedirs(os.path.join(output_path, "reservations"), exist_ok=True)
+
+    for name, url in [("login.json", "/login.json?caller=pro"),
+                      ("listdata.json", "/list/listdata.json?compsubject=location&order=asc&sort=name&page=1&page_size=999&obj_cache_accl=0&max_capacity=9999999&caller=pro-ListService.getData")]:
+        with open(os.path.join(output_path, name), "w") as f:
+            json.dump(get_events.req_25live_endpoint(url, cache=False), f)
+
+    for space in tqdm(get_events.get_all_25live_spaces()):
+        url = f"/rm_reservations.json?space_id={space['id']}&start_dt={start_dt}T00:00:00&end_dt={end_dt}T23:59:00&include=closed+blackouts+pending+related+empty&caller=pro-ReservationService.getReservations"
+        data = get_events.req_25live_endpoint(url, cache=False)["space_reservations"].get("space_reservation", [])
+
+        with open(os.path.join(output_path, "reservations", f"{space['id']}.json"), "w") as f:
+            json.dump(data if isinstance(data, list) else [data], f)
+
+    shutil.copy(get_events.SOC_FILE, output_path)
+    shutil.copy(get_events.REGISTRAR_FILE, output_path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Benchmarks update and query performance against a local stand-in for 25Live.
+
+    python3 bench/run.py [--scales 1,10,100] [--repeat 3] [--output bench-results.json]
+                         [--fixture DIR] [--baseline OLD_RESULTS.json] [--threshold 0.2] [--no-update]
+
+Each scale gets a synthetic fixture (see fixtures.py) of that multiple of the campus size, unless
+--fixture points at a recorded one (see record.py). Results are written as JSON; with --baseline,
+stages whose median time grew by more than --threshold are reported and the exit status is 1.
+
+The download stages run without the rate limit; the "cmuroom update" stage is the whole command at
+the configured FETCH_RATE_LIMIT, run once per scale (several minutes at 100x, see --no-update).
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BENCH_PATH = os.path.abspath(os.path.dirname(__file__))
+REPO_PATH = os.path.dirname(BENCH_PATH)
+sys.path.insert(0, BENCH_PATH)
+
+import fixtures
+from server import StandInServer
+
+DATE = datetime(2021, 9, 8)
+
+# Queries over several dates read the events of DATE stored again on the same weekday of the next weeks
+WEEKS = 4
+
+# (stage name, cmuroom arguments). available and available-soon count from the current time of day,
+# so their durations are kept short enough to not run past midnight.
+COMMANDS = [
+    ("cmuroom --help", ["--help"]),
+    ("cmuroom categories", ["categories"]),
+    ("cmuroom rooms", ["rooms", "-C", "all"]),
+    ("cmuroom room", ["room", "-D", DATE.strftime("%Y-%m-%d"), "0"]),
+    ("cmuroom available", ["available", "-C", "all", "-D", DATE.strftime("%Y-%m-%d"), "0.01"]),
+    ("cmuroom available-at", ["available-at", "-C", "all", "-D", DATE.strftime("%Y-%m-%d"), "10am", "12pm"]),
+    ("cmuroom available-soon", ["available-soon", "-C", "all", "-D", DATE.strftime("%Y-%m-%d"), "0.01", "0.01"]),
+    ("cmuroom available-recurring", ["available-recurring", "-C", "all", "--from", DATE.strftime("%Y-%m-%d"),
+                                     "--to", (DATE + timedelta(weeks=WEEKS - 1)).strftime("%Y-%m-%d"), "10am", "12pm"]),
+    ("cmuroom refresh", ["refresh", "-D", DATE.strftime("%Y-%m-%d")]),
+    ("cmuroom stats", ["stats", "-C", "all", "--from", DATE.strftime("%Y-%m-%d"),
+                       "--to", (DATE + timedelta(weeks=WEEKS - 1)).strftime("%Y-%m-%d")]),
+]
+
+def measure(path, repeat):
+    """Runs in a child process with the fixture as working directory and prints the timings as JSON"""
+    sys.path.insert(0, REPO_PATH)
+    os.chdir(path)
+
+    with open("cookie.dat", "w") as f:
+        f.write("benchmark")
+
+    import pickle
+    import get_events
+    import store
+    import utils
+
+    # Measure cold downloads at full speed
+    get_events.CACHE_DIR = None
+    get_events.RATE_LIMITER = get_events.RateLimiter(0)
+
+    results = {}
+
+    def timed(name, fn):
+        runs = []
+        for _ in range(repeat):
+            get_events.RESPONSE_CACHE.clear()
+            start = time.perf_counter()
+            out = fn()
+            runs.append(time.perf_counter() - start)
+        results[name] = {"min": min(runs), "median": statistics.median(runs), "runs": runs}
+        return out
+
+    spaces = timed("get_all_spaces", get_events.get_all_spaces)
+    soc_timings, _ = get_events.get_all_soc_timings()
+    course_names = get_events.get_all_soc_course_names()
+    events = timed("get_all_events", lambda: get_events.get_all_events(spaces, soc_timings, DATE, course_names))
+
+    with open("spaces.pkl", "wb+") as f:
+        pickle.dump(spaces, f)
+
+    with open(store.SPACE_INDEX_FILE, "wb+") as f:
+        pickle.dump(store.build_space_index(spaces, store.file_stamp("spaces.pkl")), f)
+
+    conn = store.connect()
+    for week in range(WEEKS):
+        store.save_events(conn, (DATE + timedelta(weeks=week)).strftime("%Y-%m-%d"), events, replace=True)
+    conn.close()
+
+    loaded = timed("load_events", lambda: utils.load_events(DATE.strftime("%Y-%m-%d")))
+    timed("events_to_blocks", lambda: [utils.events_to_blocks(x) for x in loaded.values()])
+
+    env = dict(os.environ, CMUROOM_DATA_DIR=path)
+    for name, args in COMMANDS:
+        timed(name, lambda: subprocess.run([sys.executable, os.path.join(REPO_PATH, "cmuroom"), *args],
+                                           env=env, stdout=subprocess.DEVNULL, check=True))
+
+    results["_counts"] = {"spaces": len(spaces), "events": sum(len(x) for x in events.values())}
+    print(json.dumps(results))
+
+def run_scale(fixture_path, repeat, update=True):
+    with StandInServer(fixture_path) as server:
+        env = dict(os.environ, CMUROOM_25LIVE_URL=server.url)
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--measure", fixture_path, "--repeat", str(repeat)],
+                              env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+
+        if proc.returncode != 0:
+            print(proc.stderr, file=sys.stderr)
+            raise RuntimeError(f"Benchmark failed for {fixture_path}")
+
+        results = json.loads(proc.stdout.strip().splitlines()[-1])
+        # Per run of the download stages
+        results["_counts"]["requests"] = server.requests // repeat
+        results["_counts"]["bytes"] = server.bytes_sent // repeat
+
+        if update:
+            # After the stages above, which the queries read from, as it replaces their events
+            start = time.perf_counter()
+            subprocess.run([sys.executable, os.path.join(REPO_PATH, "cmuroom"), "update", "-D", DATE.strftime("%Y-%m-%d"), "--restart"],
+                           env=dict(env, CMUROOM_DATA_DIR=fixture_path), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+            runs = [time.perf_counter() - start]
+            results["cmuroom update"] = {"min": runs[0], "median": runs[0], "runs": runs}
+
+        return results
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for scale, stages in results.items():
+        for stage, timing in stages.items():
+            old = baseline.get("results", {}).get(scale, {}).get(stage)
+            if stage.startswith("_") or old is None:
+                continue
+            if timing["median"] > old["median"] * (1 + threshold):
+                regressions.append(f"{scale} {stage}: {old['median']:.4f}s -> {timing['median']:.4f}s")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark update and query performance against a local stand-in for 25Live")
+    parser.add_argument("--scales", default="1,10,100", help="comma-separated multiples of the campus size (default 1,10,100)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage (default 3)")
+    parser.add_argument("--fixture", default=None, help="recorded fixture directory to use instead of synthetic ones")
+    parser.add_argument("--output", default="bench-results.json", help="where to write the results (default bench-results.json)")
+    parser.add_argument("--baseline", default=None, help="earlier results to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown against the baseline (default 0.2)")
+    parser.add_argument("--no-update", action="store_true", help="skip the rate limited cmuroom update stage")
+    parser.add_argument("--measure", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure, args.repeat)
+        return
+
+    results = {}
+    scales = ["recorded"] if args.fixture else [int(x) for x in args.scales.split(",")]
+
+    for scale in scales:
+        name = scale if scale == "recorded" else f"{scale}x"
+        tmp_path = tempfile.mkdtemp(prefix="cmuroom-bench-")
+        try:
+            if args.fixture:
+                shutil.copytree(args.fixture, tmp_path, dirs_exist_ok=True)
+            else:
+                fixtures.generate(tmp_path, scale)
+
+            results[name] = run_scale(tmp_path, args.repeat, update=not args.no_update)
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+        counts = results[name]["_counts"]
+        print(f"{name}: {counts['spaces']} spaces, {counts['events']} events, {counts['requests']} requests")
+        for stage, timing in results[name].items():
+            if not stage.startswith("_"):
+                print(f"  {stage.ljust(28)} median {timing['median']:.4f}s  min {timing['min']:.4f}s")
+
+    output = {
+        "meta": {
+            "time": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat
+        },
+        "results": results
+    }
+
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+
+        for x in regressions:
+            print(f"Regression: {x}")
+
+        if len(regressions) > 0:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
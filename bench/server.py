@@ -0,0 +1,95 @@
+import json
+import os
+import threading
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+PREFIX = ")]}',\n"
+
+class StandInServer:
+    """
+    Serves a fixture directory (see fixtures.py) the way 25Live serves its data endpoints. Point
+    get_events.py at it by setting CMUROOM_25LIVE_URL to `url`.
+    """
+
+    def __init__(self, fixture_path, port=0):
+        self.fixture_path = fixture_path
+        self.requests = 0
+        self.bytes_sent = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/run"
+        self._files = {}
+
+    def _read(self, name):
+        if name not in self._files:
+            with open(os.path.join(self.fixture_path, name), "r") as f:
+                self._files[name] = json.load(f)
+        return self._files[name]
+
+    def _reservations(self, query):
+        space_id = query["space_id"][0]
+        start = datetime.fromisoformat(query["start_dt"][0])
+        end = datetime.fromisoformat(query["end_dt"][0])
+
+        try:
+            reservations = self._read(os.path.join("reservations", f"{space_id}.json"))
+        except FileNotFoundError:
+            reservations = []
+
+        # Same overlap rule as the real endpoint: anything intersecting [start, end]
+        reservations = [x for x in reservations
+                        if datetime.fromisoformat(x["reservation_start_dt"][:19]) <= end and
+                           datetime.fromisoformat(x["reservation_end_dt"][:19]) >= start]
+
+        if len(reservations) == 0:
+            return {"space_reservations": {}}
+        return {"space_reservations": {"space_reservation": reservations if len(reservations) > 1 else reservations[0]}}
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+
+                try:
+                    if url.path.endswith("/login.json"):
+                        body = server._read("login.json")
+                    elif url.path.endswith("/list/listdata.json"):
+                        body = server._read("listdata.json")
+                    elif url.path.endswith("/rm_reservations.json"):
+                        body = server._reservations(query)
+                    else:
+                        self.send_error(404)
+                        return
+                except (OSError, KeyError, ValueError) as e:
+                    self.send_error(500, str(e))
+                    return
+
+                data = (PREFIX + json.dumps(body)).encode()
+                with server.lock:
+                    server.requests += 1
+                    server.bytes_sent += len(data)
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
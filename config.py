@@ -25,3 +25,37 @@ FANCY_TABLE = True
 
 MAX_WIDTH = 80
 MIN_AVAILABLE_TIME_SECONDS = 30*60 # Availability <30 minutes is marked as red
+
+# Default time range of `cmuroom stats`
+STATS_FROM_TIME = "8am"
+STATS_TO_TIME = "10pm"
+
+# 25Live login
+COOKIE_CHECK_TTL = 5*60 # Seconds a successful check of the session cookie is trusted for
+COOKIE_CHECK_TIMEOUT = 5 # Seconds
+LOGIN_PAGE_TIMEOUT = 30 # Seconds to wait for the 25Live/CMU login pages in `get-cookie`
+LOGIN_TIMEOUT = 180 # Seconds to wait for login to finish, including Duo 2FA
+
+# 25Live download settings
+FETCH_WORKERS = 16 # Number of spaces fetched concurrently (1 = serial)
+FETCH_RATE_LIMIT = 100 # Max requests per second to each host (0 = unlimited); a full update is one request per space
+FETCH_RETRIES = 4
+FETCH_BACKOFF = 0.5 # Seconds, doubled after each failed attempt
+FETCH_TIMEOUT = 30 # Seconds
+FETCH_ASYNC = False # Download reservations with the asyncio client (needs aiohttp) instead of FETCH_WORKERS threads
+FETCH_ASYNC_CONCURRENCY = 64 # Max requests in flight with the asyncio client
+PROCESS_WORKERS = 1 # Processes building events from the downloaded reservations (1 = no extra processes, None = one per core)
+PROCESS_BATCH_SIZE = 16 # Spaces handed to a process at a time
+
+# Completed spaces of an unfinished update, which the next update of the same dates resumes from
+UPDATE_CHECKPOINT = "update.checkpoint"
+
+# 25Live response cache
+CACHE_DIR = None # On-disk cache directory, e.g. "cache" (None = memory only, for the length of one update)
+CACHE_TTL_SECONDS = 60*60 # Responses older than this are downloaded again, and deleted by the next update
+CACHE_MEMORY_ENTRIES = 256
+
+# Query daemon (`cmuroom serve`)
+DAEMON_SOCKET = "cmuroom.sock"
+DAEMON_TIMEOUT = 2 # Seconds before falling back to answering the query locally
+DAEMON_REFRESH_SECONDS = 60 # Max time between checks for an update that `available` needs refreshing for
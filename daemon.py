@@ -0,0 +1,129 @@
+import json
+import os
+import socket
+import threading
+from datetime import datetime
+from config import *
+import store
+import utils
+import profiling
+
+# Protocol: each request is one line of JSON, {"command": ..., "args": {...}}, where command is one of
+# utils.QUERIES and args are its keyword arguments. Each response is one line of JSON, either
+# {"result": ...} or {"error": "message"}. A connection may be kept open for several requests.
+
+# Both the daemon and the commands that look for it use this path
+SOCKET_PATH = os.environ.get("CMUROOM_SOCKET", DAEMON_SOCKET)
+
+def request(command, args, path=SOCKET_PATH):
+    """Sends a query to the daemon. Returns the decoded response, or None if no daemon is running."""
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(DAEMON_TIMEOUT)
+            sock.connect(path)
+            sock.sendall(json.dumps({"command": command, "args": args}).encode() + b"\n")
+            sock.shutdown(socket.SHUT_WR)
+            response = sock.makefile("rb").readline()
+    except OSError:
+        return None
+
+    if len(response) == 0:
+        return None
+
+    return json.loads(response)
+
+@profiling.timed("query")
+def run_query(command, **args):
+    """Answers a query through the daemon if one is running, and in this process otherwise"""
+    response = request(command, args)
+
+    if response is None:
+        return utils.QUERIES[command](**args)
+
+    profiling.count("daemon queries")
+
+    if "error" in response:
+        raise utils.QueryError(response["error"])
+
+    return response["result"]
+
+def handle_request(line):
+    try:
+        req = json.loads(line)
+        return {"result": utils.QUERIES[req["command"]](**req.get("args", {}))}
+    except utils.QueryError as e:
+        return {"error": str(e)}
+    except (ValueError, KeyError, TypeError) as e:
+        return {"error": f"Invalid request: {e!r}"}
+
+def refresh_free_now(stop):
+    """
+    Keeps today's rows of the free_now table current, waking up when the next free window ends (or
+    after DAEMON_REFRESH_SECONDS, to pick up updates) until `stop` is set
+    """
+    conn = store.connect(store.FREE_NOW_DB, store.FREE_NOW_SCHEMA)
+
+    while not stop.is_set():
+        now = datetime.now()
+        date = now.strftime("%Y-%m-%d")
+        minute = now.hour * 60 + now.minute
+
+        try:
+            utils.refresh_free_now(conn, date, minute)
+            change = store.next_free_now_change(conn, date, minute)
+        except Exception as e:
+            print(f"Could not refresh available rooms: {e!r}")
+            change = None
+
+        wait = DAEMON_REFRESH_SECONDS
+        if change is not None:
+            wait = min(wait, (change - minute) * 60 - now.second - now.microsecond / 1e6)
+        stop.wait(max(wait, 1))
+
+    conn.close()
+
+def _remove_stale_socket(path):
+    """
+    Removes the socket file left behind by a daemon that was killed. Raises OSError if a daemon is
+    still listening on it.
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(path)
+    except FileNotFoundError:
+        return
+    except ConnectionRefusedError:
+        os.remove(path)
+        return
+
+    raise OSError(f"A daemon is already running on {os.path.abspath(path)}")
+
+def serve(path=SOCKET_PATH):
+    import socketserver
+
+    class QueryHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                self.wfile.write(json.dumps(handle_request(line)).encode() + b"\n")
+                self.wfile.flush()
+
+    utils.enable_snapshot_cache()
+
+    _remove_stale_socket(path)
+
+    with socketserver.ThreadingUnixStreamServer(path, QueryHandler) as server:
+        print(f"Listening on {os.path.abspath(path)}", flush=True)
+
+        stop = threading.Event()
+        threading.Thread(target=refresh_free_now, args=(stop,), daemon=True).start()
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stop.set()
+            os.remove(path)
@@ -1,40 +1,83 @@
-import time
 import sys
-import getpass
-from selenium import webdriver
-from selenium.webdriver.firefox.options import Options as FirefoxOptions
+from config import *
+import auth
 
 USER = "asinghan"
-PASS = getpass.getpass()
-COOKIE_FILE = "cookie.dat"
+COOKIE_FILE = auth.COOKIE_FILE
 
-options = FirefoxOptions()
-options.add_argument("--headless")
-driver = webdriver.Firefox(options=options)
+URL_25LIVE = "https://25live.collegenet.com"
+SSO_URL = "https://login.cmu.edu/idp/profile/SAML2/Redirect/SSO"
 
-print("Loading 25Live", file=sys.stderr)
-driver.get("https://25live.collegenet.com/pro/cmu")
+def _logged_in(driver):
+    """Whether the browser is back on 25Live with a session cookie that is logged in"""
+    if not driver.current_url.startswith(URL_25LIVE):
+        return False
 
-print("Waiting for authentication page", file=sys.stderr)
-time.sleep(10)
+    cookie = driver.get_cookie("WSSESSIONID")
+    try:
+        return cookie is not None and auth.check_cookie(cookie["value"], max_age=0) is not None
+    except Exception:
+        return False
 
-if driver.current_url.startswith("https://login.cmu.edu/idp/profile/SAML2/Redirect/SSO"):
-    print("Need to authenticate", file=sys.stderr)
-    time.sleep(3)
+def fetch_cookie(user=USER, cookie_file=COOKIE_FILE, force=False):
+    """
+    Logs in to 25Live in a headless Firefox (asking for the password) and saves the session cookie,
+    unless the saved one is still logged in and `force` is not set. Returns whether it logged in.
+    """
+    if not force:
+        cookie = auth.read_cookie(cookie_file)
+        try:
+            if cookie is not None and auth.check_cookie(cookie) is not None:
+                return False
+        except Exception:
+            pass
 
-    driver.find_element_by_id("username").send_keys(USER)
-    driver.find_element_by_id("passwordinput").send_keys(PASS)
-    driver.find_element_by_class_name("loginbutton").click()
+    import getpass
+    from selenium import webdriver
+    from selenium.common.exceptions import TimeoutException
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.firefox.options import Options as FirefoxOptions
+    from selenium.webdriver.support import expected_conditions
+    from selenium.webdriver.support.ui import WebDriverWait
 
-    time.sleep(3)
+    password = getpass.getpass()
 
-print("Waiting for redirect", file=sys.stderr)
-while not driver.current_url.startswith("https://25live.collegenet.com"):
-    time.sleep(0.1)
+    options = FirefoxOptions()
+    options.add_argument("--headless")
+    driver = webdriver.Firefox(options=options)
 
-print("25Live found", file=sys.stderr)
+    try:
+        print("Loading 25Live", file=sys.stderr)
+        driver.get(URL_25LIVE + "/pro/cmu")
 
-with open(COOKIE_FILE, "w+") as f:
-    f.write(driver.get_cookie("WSSESSIONID")["value"])
+        print("Waiting for authentication page", file=sys.stderr)
+        WebDriverWait(driver, LOGIN_PAGE_TIMEOUT, poll_frequency=0.5).until(
+            lambda d: d.current_url.startswith(SSO_URL) or _logged_in(d))
 
-driver.quit()
+        if driver.current_url.startswith(SSO_URL):
+            print("Need to authenticate", file=sys.stderr)
+            WebDriverWait(driver, LOGIN_PAGE_TIMEOUT).until(
+                expected_conditions.element_to_be_clickable((By.CLASS_NAME, "loginbutton")))
+
+            driver.find_element(By.ID, "username").send_keys(user)
+            driver.find_element(By.ID, "passwordinput").send_keys(password)
+            driver.find_element(By.CLASS_NAME, "loginbutton").click()
+
+        print("Waiting for redirect", file=sys.stderr)
+        WebDriverWait(driver, LOGIN_TIMEOUT, poll_frequency=0.5).until(_logged_in)
+
+        print("25Live found", file=sys.stderr)
+
+        with open(cookie_file, "w+") as f:
+            f.write(driver.get_cookie("WSSESSIONID")["value"])
+
+    except TimeoutException:
+        raise TimeoutError(f"Timed out waiting for 25Live login at {driver.current_url}")
+
+    finally:
+        driver.quit()
+
+    return True
+
+if __name__ == "__main__":
+    fetch_cookie(force="--force" in sys.argv)
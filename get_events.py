@@ -1,22 +1,32 @@
 import requests
 import json
-import pandas as pd
-import cmu_course_api
-from datetime import datetime
-from pprint import pprint
+from datetime import datetime, timedelta
 import dateutil.parser
 import string
 import re
-import copy
-from tqdm import tqdm
+import bisect
+import functools
 import sys
+import argparse
 import pickle
+import threading
+import time
+import multiprocessing
+import os
+import hashlib
+import asyncio
+import contextvars
+import queue
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from config import *
-
-with open("cookie.dat", "r") as f:
-    COOKIES_25LIVE = {"WSSESSIONID": f.read().strip()}
-
-BASE_URL_25LIVE = "https://25live.collegenet.com/25live/data/cmu/run"
+import store
+import profiling
+import auth
+from auth import COOKIE_FILE, BASE_URL_25LIVE
 
 SOC_FILE = "courses-f21.txt"
 
@@ -24,20 +34,243 @@ SOC_FILE = "courses-f21.txt"
 # Parsed using https://tabula.technology/
 REGISTRAR_FILE = "registrar-classrooms-f21.csv"
 
+# SOC and 25Live events whose start and end times are both this close are treated as the same event
+MERGE_TOLERANCE_SECONDS = 5 * 60
+
 def strip(x):
     return " ".join(x.strip().split())
 
-def req_25live_endpoint(url):
-    out = requests.get(BASE_URL_25LIVE + url, cookies=COOKIES_25LIVE).text
-    assert out.startswith(")]}\',\n")
-    out = out[len(")]}\',\n"):]
-    out = json.loads(out)
+class RateLimiter:
+    """Spaces out requests so that each host sees at most `rate` requests per second"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.lock = threading.Lock()
+        self.next_slot = {}
+
+    def reserve(self, host):
+        """Takes the next request slot for the host and returns how many seconds until it starts"""
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+
+        return slot - now
+
+    def wait(self, host):
+        delay = self.reserve(host)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+
+def make_session(cookies, pool_size):
+    retry = Retry(total=FETCH_RETRIES, backoff_factor=FETCH_BACKOFF,
+                  status_forcelist=RETRY_STATUSES, allowed_methods=["GET"])
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.cookies.update(cookies)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def make_async_session(cookies):
+    """aiohttp session for the async client, keeping up to FETCH_ASYNC_CONCURRENCY connections alive"""
+    import aiohttp
+    connector = aiohttp.TCPConnector(limit=FETCH_ASYNC_CONCURRENCY, limit_per_host=FETCH_ASYNC_CONCURRENCY)
+    return aiohttp.ClientSession(cookies=cookies, connector=connector,
+                                 timeout=aiohttp.ClientTimeout(total=FETCH_TIMEOUT))
+
+class UpdateError(Exception):
+    """An update that cannot go on, e.g. because of a missing or expired cookie"""
+
+# Set up by login(), which the first 25Live request calls if it hasn't been yet
+COOKIES_25LIVE = None
+SESSION_25LIVE = None
+
+def login(cookie_file=COOKIE_FILE):
+    """
+    Starts a 25Live session with the cookie from `cookie_file`, after checking that it is still
+    logged in (see auth.check_cookie, which skips the request if it was checked a moment ago)
+    """
+    global COOKIES_25LIVE, SESSION_25LIVE
+
+    cookie = auth.read_cookie(cookie_file)
+    if cookie is None:
+        raise UpdateError("No cookie found. Run `get-cookie` command to log in.")
+
+    try:
+        username = auth.check_cookie(cookie)
+    except requests.RequestException as e:
+        raise UpdateError(f"Could not log in to 25Live: {e!r}")
+
+    if username is None:
+        raise UpdateError("Invalid cookie. Run `get-cookie` command to log in again.")
+
+    COOKIES_25LIVE = {"WSSESSIONID": cookie}
+    SESSION_25LIVE = make_session(COOKIES_25LIVE, FETCH_WORKERS)
+
+# Responses to requests with a cookie that is no longer logged in
+EXPIRED_STATUSES = [401, 403]
+
+def _check_expired(status):
+    if status in EXPIRED_STATUSES:
+        auth.forget_cookie_check()
+        raise UpdateError("25Live session expired. Run `get-cookie` command to log in again.")
+
+RATE_LIMITER = RateLimiter(FETCH_RATE_LIMIT)
+
+# [seconds] that the requests of the current download spent waiting on RATE_LIMITER, so that the
+# "reservations per space" latency leaves out the throttling (reported separately)
+_RATE_LIMIT_WAIT = contextvars.ContextVar("rate_limit_wait", default=None)
+
+def _count_rate_limit_wait(delay):
+    profiling.sample("25Live rate limit wait", delay)
+    waited = _RATE_LIMIT_WAIT.get()
+    if waited is not None:
+        waited[0] += delay
+
+RESPONSE_CACHE = OrderedDict()
+RESPONSE_CACHE_LOCK = threading.Lock()
+
+def _cache_path(url):
+    return os.path.join(CACHE_DIR, hashlib.sha1(url.encode()).hexdigest() + ".json")
+
+def _cache_get(url):
+    with RESPONSE_CACHE_LOCK:
+        if url in RESPONSE_CACHE:
+            RESPONSE_CACHE.move_to_end(url)
+            return RESPONSE_CACHE[url]
+
+    if not CACHE_DIR:
+        return None
+
+    path = _cache_path(url)
+    try:
+        if time.time() - os.path.getmtime(path) > CACHE_TTL_SECONDS:
+            return None
+        with open(path, "r") as f:
+            out = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    _cache_put(url, out, None)
     return out
 
-login = req_25live_endpoint("/login.json?caller=pro")
-if "login_response" not in login or "login" not in login["login_response"] or "username" not in login["login_response"]["login"]:
-    print("Invalid cookie")
-    sys.exit(1)
+def prune_cache():
+    """Clears the memory cache and deletes on-disk entries older than CACHE_TTL_SECONDS"""
+    with RESPONSE_CACHE_LOCK:
+        RESPONSE_CACHE.clear()
+
+    if not CACHE_DIR:
+        return
+
+    try:
+        names = os.listdir(CACHE_DIR)
+    except OSError:
+        return
+
+    now = time.time()
+    for name in names:
+        path = os.path.join(CACHE_DIR, name)
+        try:
+            if now - os.path.getmtime(path) > CACHE_TTL_SECONDS:
+                os.remove(path)
+        except OSError:
+            pass
+
+def _cache_put(url, out, raw):
+    with RESPONSE_CACHE_LOCK:
+        RESPONSE_CACHE[url] = out
+        RESPONSE_CACHE.move_to_end(url)
+        while len(RESPONSE_CACHE) > CACHE_MEMORY_ENTRIES:
+            RESPONSE_CACHE.popitem(last=False)
+
+    if not CACHE_DIR or raw is None:
+        return
+
+    # Write to a temporary file first so that an interrupted update never leaves a truncated entry
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = _cache_path(url)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(raw)
+    os.replace(tmp_path, path)
+
+def req_25live_endpoint(url, cache=True, refresh=False):
+    if cache and not refresh:
+        out = _cache_get(url)
+        if out is not None:
+            profiling.count("25Live cache hits")
+            return out
+
+    if SESSION_25LIVE is None:
+        login()
+
+    _count_rate_limit_wait(RATE_LIMITER.wait(urlparse(BASE_URL_25LIVE).netloc))
+    start = time.perf_counter()
+    response = SESSION_25LIVE.get(BASE_URL_25LIVE + url, timeout=FETCH_TIMEOUT)
+    _count_request(start, len(response.content))
+    _check_expired(response.status_code)
+    out, raw = _parse_25live_response(response.text)
+
+    if cache:
+        _cache_put(url, out, raw)
+
+    return out
+
+def _count_request(start, size):
+    profiling.sample("25Live request", time.perf_counter() - start)
+    profiling.count("25Live requests")
+    profiling.count("25Live bytes", size)
+
+def _parse_25live_response(raw):
+    """Returns the decoded response and its JSON text"""
+    assert raw.startswith(")]}\',\n")
+    raw = raw[len(")]}\',\n"):]
+    return json.loads(raw), raw
+
+async def req_25live_endpoint_async(session, url, cache=True, refresh=False):
+    """
+    Same as req_25live_endpoint, using an aiohttp session from make_async_session. The cache and
+    JSON decoding run in the loop's default executor so that they don't hold up other requests.
+    """
+    import aiohttp
+    loop = asyncio.get_running_loop()
+
+    if cache and not refresh:
+        out = await loop.run_in_executor(None, _cache_get, url)
+        if out is not None:
+            profiling.count("25Live cache hits")
+            return out
+
+    for attempt in range(FETCH_RETRIES + 1):
+        delay = RATE_LIMITER.reserve(urlparse(BASE_URL_25LIVE).netloc)
+        await asyncio.sleep(delay)
+        _count_rate_limit_wait(delay)
+        try:
+            start = time.perf_counter()
+            async with session.get(BASE_URL_25LIVE + url) as response:
+                if response.status not in RETRY_STATUSES or attempt == FETCH_RETRIES:
+                    body = await response.read()
+                    _count_request(start, len(body))
+                    _check_expired(response.status)
+                    text = body.decode(response.get_encoding())
+                    break
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            if attempt == FETCH_RETRIES:
+                raise
+
+        await asyncio.sleep(FETCH_BACKOFF * 2 ** attempt)
+
+    out, raw = await loop.run_in_executor(None, _parse_25live_response, text)
+
+    if cache:
+        await loop.run_in_executor(None, _cache_put, url, out, raw)
+
+    return out
 
 
 def get_25live_space_categories():
@@ -47,10 +280,12 @@ def get_25live_space_categories():
     data = {x["itemId"]: x["itemName"] for x in data}
     return data
 
-def get_all_25live_spaces():
-    page_size = 999
-    url = f"/list/listdata.json?compsubject=location&order=asc&sort=name&page=1&page_size={page_size}&obj_cache_accl=0&max_capacity=9999999&caller=pro-ListService.getData"
-    data = req_25live_endpoint(url)
+SPACES_URL_25LIVE = "/list/listdata.json?compsubject=location&order=asc&sort=name&page=1&page_size=999&obj_cache_accl=0&max_capacity=9999999&caller=pro-ListService.getData"
+
+def get_all_25live_spaces(refresh=False):
+    return _parse_25live_spaces(req_25live_endpoint(SPACES_URL_25LIVE, refresh=refresh))
+
+def _parse_25live_spaces(data):
     cols = [(x["prefname"] if "prefname" in x else x["name"]) for x in data["cols"]]
     rows = [{cols[i]: a for i, a in enumerate(x["row"])} for x in data["rows"]]
     spaces = [{
@@ -66,15 +301,24 @@ def get_all_25live_spaces():
 
     return spaces
 
-def get_25live_timings_for_space(space_id, date, course_names={}):
-    dt = date.strftime("%Y-%m-%d")
-    url = f"/rm_reservations.json?space_id={space_id}&start_dt={dt}T00:00:00&end_dt={dt}T23:59:00&include=closed+blackouts+pending+related+empty&caller=pro-ReservationService.getReservations"
+def _reservations_url(space_id, date, end_date=None):
+    start_dt = date.strftime("%Y-%m-%d")
+    end_dt = (end_date or date).strftime("%Y-%m-%d")
+    return f"/rm_reservations.json?space_id={space_id}&start_dt={start_dt}T00:00:00&end_dt={end_dt}T23:59:00&include=closed+blackouts+pending+related+empty&caller=pro-ReservationService.getReservations"
+
+def get_25live_timings_for_space(space_id, date, course_names={}, end_date=None, refresh=False):
+    data = req_25live_endpoint(_reservations_url(space_id, date, end_date), refresh=refresh)
+    return _parse_25live_timings(space_id, data, course_names)
+
+@profiling.timed("parse reservations")
+def _parse_25live_timings(space_id, data, course_names):
+    data = data["space_reservations"]
 
-    if "space_reservation" not in req_25live_endpoint(url)["space_reservations"]:
+    if "space_reservation" not in data:
         print(f"Warning: no reservations found for {space_id}")
         return []
 
-    data = req_25live_endpoint(url)["space_reservations"]["space_reservation"]
+    data = data["space_reservation"]
 
     if not isinstance(data, list):
         data = [data]
@@ -126,24 +370,27 @@ def soc_include_location(building, room):
                         "HH", "HL", "HOA", "MI", "MM", "NSH", "PCA", "PH", "POS", "REH",
                         "TCS", "TEP", "WEH", "WW"]
 
-def get_all_soc_course_names():
-    with open(SOC_FILE, "r") as f:
-        data = json.load(f)
-
-    data = data["courses"]
-    data = {k.replace("-", ""): v["name"] for k, v in data.items()}
-    return data
+@functools.lru_cache(maxsize=None)
+def _soc_time_seconds(time):
+    # SOC times are strings such as "10:00AM", and only a few hundred distinct ones exist
+    time = dateutil.parser.parse(time)
+    return time.hour * 3600 + time.minute * 60 + time.second
 
-def get_all_soc_timings():
-    with open(SOC_FILE, "r") as f:
+@functools.lru_cache(maxsize=1)
+@profiling.timed("load SOC")
+def _load_soc(path, mtime):
+    with open(path, "r") as f:
         data = json.load(f)
 
     data = data["courses"]
 
-    timings = []
+    timings = [{} for day in range(7)]
     locations = set()
+    course_names = {}
 
     for k, v in data.items():
+        course_names[k.replace("-", "")] = v["name"]
+
         course_info = {
             "number": k,
             "name": v["name"],
@@ -162,25 +409,45 @@ def get_all_soc_timings():
                 if not soc_include_location(time["building"], time["room"]):
                     continue
 
-                locations.add(f"{time['building']} {time['room']}")
+                location = f"{time['building']} {time['room']}"
+                locations.add(location)
+
+                start_seconds = _soc_time_seconds(time["begin"])
+                end_seconds = _soc_time_seconds(time["end"])
 
                 for day in time["days"]:
-                    timings.append(dict(course_info, **{
+                    timings[day].setdefault(location, []).append(dict(course_info, **{
                         "instructors": section["instructors"],
-                        "location": f"{time['building']} {time['room']}",
+                        "location": location,
                         "start": time["begin"],
                         "end": time["end"],
+                        "start_seconds": start_seconds,
+                        "end_seconds": end_seconds,
                         "day": day
                     }))
 
-    locations = list(locations)
-    timings = [{location: [x for x in timings if x["day"] == day and x["location"] == location] for location in locations}
-               for day in range(7)]
+    return timings, sorted(locations), course_names
+
+def load_soc():
+    """
+    Parses SOC_FILE in a single pass, returning (timings, locations, course_names) where
+    timings[day][location] lists the sections meeting there. Reused until the file changes.
+    """
+    return _load_soc(SOC_FILE, os.path.getmtime(SOC_FILE))
+
+def get_all_soc_course_names():
+    return load_soc()[2]
+
+def get_all_soc_timings():
+    timings, locations, _ = load_soc()
 
-    return timings, locations
+    # Callers consume the list of locations as they match them
+    return timings, list(locations)
 
 
 def get_registrar_spaces():
+    # Imported here so that the event building processes start without pandas
+    import pandas as pd
     data = pd.read_csv(REGISTRAR_FILE)
     data = data.where(data.notnull(), None).to_dict("records")
 
@@ -218,11 +485,76 @@ def get_registrar_spaces():
     return spaces
 
 
-def get_all_spaces():
+def normalize_space_key(location):
+    # Punctuation separates words too, so that "WEH 5403/5415" or "POS 151," contain "WEH 5403" or "POS 151"
+    return " ".join(re.sub(r"[\W_]+", " ", location.upper()).split())
+
+def _candidate_space_keys(name, max_tokens=3):
+    """All runs of 2 to max_tokens consecutive words in the name, normalized, in order of position"""
+    tokens = normalize_space_key(name).split()
+    return [" ".join(tokens[i:i+n]) for i in range(len(tokens)) for n in range(2, max_tokens + 1) if i + n <= len(tokens)]
+
+def _match_space(names, index, ambiguous):
+    """
+    Finds the entry of `index` (normalized location -> value) that appears as a run of words in any of
+    the names. If several different entries appear, the first one is used and the conflict is recorded
+    in `ambiguous`.
+    """
+    matches = []
+    for name in names:
+        for key in _candidate_space_keys(name):
+            if key in index and key not in matches:
+                matches.append(key)
+
+    if len(matches) > 1:
+        ambiguous.append((names[0], [index[x] for x in matches]))
+
+    return matches[0] if len(matches) > 0 else None
+
+def _registrar_category(room_type):
+    if room_type == "COMPUTER LAB":
+        return "computer_lab"
+    elif room_type in ["CLASSROOM", "LEARNING HALL", "AUDITORIUM"]:
+        return "classroom"
+    elif room_type.startswith("LAB") or room_type.startswith("WET LAB"):
+        return "lab"
+    elif room_type == "SPECIALTY SHOP":
+        return "special_lab"
+    elif room_type.startswith("STUDIO") or room_type.startswith("THEATRE"):
+        return "studio"
+    return None
+
+def _registrar_comment(registrar_space):
+    comment = ""
+
+    if registrar_space["name"] and len(registrar_space["name"]) > 1:
+        comment += "Registrar Name: {}\n".format(registrar_space["name"])
+
+    if registrar_space["type"]:
+        comment += "Registrar Category: {}\n".format(registrar_space["type"])
+
+    if registrar_space["department"]:
+        comment += "Registrar Department: {}\n".format(registrar_space["department"])
+
+    return comment + "\n"
+
+def _apply_overrides(space):
+    for s, ok, ov in OVERRIDES:
+        if s == space["location"]:
+            assert ok in space.keys()
+            space[ok] = ov
+
+@profiling.timed("get_all_spaces")
+def get_all_spaces(refresh=False):
     registrar_spaces = get_registrar_spaces()
     soc_timings, soc_spaces = get_all_soc_timings()
-    spaces_25live = get_all_25live_spaces()
+    spaces_25live = get_all_25live_spaces(refresh)
+
+    # Registrar and SOC locations not yet matched to a space, keyed by normalized location
+    registrar_index = {normalize_space_key(k): k for k in registrar_spaces}
+    soc_index = {normalize_space_key(x): x for x in soc_spaces}
 
+    ambiguous = []
     spaces = []
 
     for space25 in spaces_25live:
@@ -235,7 +567,8 @@ def get_all_spaces():
         elif any(["Computing Services Lab" in x for x in space25["categories"]]):
             category = "computer_lab"
 
-        elif "Registrar Classrooms" in space25["categories"] or (space25["name"] in list(registrar_spaces.keys()) + list(soc_spaces)):
+        elif "Registrar Classrooms" in space25["categories"] or normalize_space_key(space25["name"]) in registrar_index or \
+             normalize_space_key(space25["name"]) in soc_index:
             category = "classroom"
 
         elif len(space25["name"].split()) == 2 and soc_include_location(*space25["name"].split()):
@@ -258,61 +591,31 @@ def get_all_spaces():
         space["category"] = category
         space["comment"] = ""
 
-        registrar_match = [x for x in registrar_spaces.values() if x["location"] in space25["name"] or x["location"] in space25["full_name"]]
-        assert len(registrar_match) < 2
-        if len(registrar_match) == 1:
-            registrar_match = registrar_match[0]
-            registrar_spaces.pop(registrar_match["location"])
+        registrar_key = _match_space([space25["name"], space25["full_name"]], registrar_index, ambiguous)
+        if registrar_key is not None:
+            registrar_match = registrar_spaces.pop(registrar_index.pop(registrar_key))
 
             space["location"] = registrar_match["location"]
             space["name"] = space25["full_name"]
             space["capacity"] = max(space25["max_capacity"], registrar_match["capacity"])
-
-            if registrar_match["type"] == "COMPUTER LAB":
-                space["category"] = "computer_lab"
-            elif registrar_match["type"] in ["CLASSROOM", "LEARNING HALL", "AUDITORIUM"]:
-                space["category"] = "classroom"
-            elif registrar_match["type"].startswith("LAB") or registrar_match["type"].startswith("WET LAB"):
-                space["category"] = "lab"
-            elif registrar_match["type"] == "SPECIALTY SHOP":
-                space["category"] = "special_lab"
-            elif registrar_match["type"].startswith("STUDIO") or registrar_match["type"].startswith("THEATRE"):
-                space["category"] = "studio"
-
-            if registrar_match["name"] and len(registrar_match["name"]) > 1:
-                space["comment"] += "Registrar Name: {}\n".format(registrar_match["name"])
-
-            if registrar_match["type"]:
-                space["comment"] += "Registrar Category: {}\n".format(registrar_match["type"])
-
-            if registrar_match["department"]:
-                space["comment"] += "Registrar Department: {}\n".format(registrar_match["department"])
-
-            space["comment"] += "\n"
+            space["category"] = _registrar_category(registrar_match["type"]) or space["category"]
+            space["comment"] += _registrar_comment(registrar_match)
 
         else:
             space["location"] = space25["name"]
             space["name"] = space25["full_name"]
             space["capacity"] = space25["max_capacity"]
 
-
-        soc_match = [x for x in soc_spaces if x in space25["name"] or x in space25["full_name"]]
-        assert len(soc_match) < 2
-        if len(soc_match) == 1:
-            soc_match = soc_match[0]
-            soc_spaces.remove(soc_match)
-            space["location"] = soc_match
+        soc_key = _match_space([space25["name"], space25["full_name"]], soc_index, ambiguous)
+        if soc_key is not None:
+            space["location"] = soc_index.pop(soc_key)
 
         if len(space25["features"]) > 0:
             space["comment"] += "Features: {}\n\n".format(", ".join(space25["features"]))
 
         space["notes"] = SPACES_NOTES.get(space["location"], "")
         space["comment"] = space["comment"].strip()
-
-        for s, ok, ov in OVERRIDES:
-            if s == space["location"]:
-                assert ok in space.keys()
-                space[ok] = ov
+        _apply_overrides(space)
 
         spaces.append(space)
 
@@ -320,54 +623,23 @@ def get_all_spaces():
         space = {}
 
         space["25live_id"] = None
-        space["comment"] = ""
         space["location"] = v["location"]
         space["name"] = v["location"]
         space["capacity"] = v["capacity"]
+        space["category"] = _registrar_category(v["type"]) or "classroom"
+        space["comment"] = _registrar_comment(v)
 
-        if v["type"] == "COMPUTER LAB":
-            space["category"] = "computer_lab"
-        elif v["type"] in ["CLASSROOM", "LEARNING HALL", "AUDITORIUM"]:
-            space["category"] = "classroom"
-        elif v["type"].startswith("LAB") or v["type"].startswith("WET LAB"):
-            space["category"] = "lab"
-        elif v["type"] == "SPECIALTY SHOP":
-            space["category"] = "special_lab"
-        elif v["type"].startswith("STUDIO") or v["type"].startswith("THEATRE"):
-            space["category"] = "studio"
-        else:
-            space["category"] = "classroom"
-
-        if v["name"] and len(v["name"]) > 1:
-            space["comment"] += "Registrar Name: {}\n".format(v["name"])
-
-        if v["type"]:
-            space["comment"] += "Registrar Category: {}\n".format(v["type"])
-
-        if v["department"]:
-            space["comment"] += "Registrar Department: {}\n".format(v["department"])
-
-        space["comment"] += "\n"
-
-        soc_match = [x for x in soc_spaces if x in v["location"]]
-        assert len(soc_match) < 2
-        if len(soc_match) == 1:
-            soc_match = soc_match[0]
-            space["location"] = soc_match
-            soc_spaces.remove(soc_match)
+        soc_key = _match_space([v["location"]], soc_index, ambiguous)
+        if soc_key is not None:
+            space["location"] = soc_index.pop(soc_key)
 
         space["notes"] = SPACES_NOTES.get(space["location"], "")
         space["comment"] = space["comment"].strip()
-
-        for s, ok, ov in OVERRIDES:
-            if s == space["location"]:
-                assert ok in space.keys()
-                space[ok] = ov
+        _apply_overrides(space)
 
         spaces.append(space)
 
-
-    for x in soc_spaces:
+    for x in soc_index.values():
         space = {}
 
         space["25live_id"] = None
@@ -378,14 +650,13 @@ def get_all_spaces():
         space["category"] = "classroom"
         space["notes"] = SPACES_NOTES.get(x, "")
         space["comment"] = space["comment"].strip()
-
-        for s, ok, ov in OVERRIDES:
-            if s == space["location"]:
-                assert ok in space.keys()
-                space[ok] = ov
+        _apply_overrides(space)
 
         spaces.append(space)
 
+    for name, candidates in ambiguous:
+        print(f"Warning: '{name}' matches several locations ({', '.join(candidates)}), using {candidates[0]}")
+
     assert all(space["capacity"] >= 0 and space["capacity"] < 9999 for space in spaces)
     assert all(space["category"] in CATEGORIES for space in spaces)
 
@@ -393,10 +664,9 @@ def get_all_spaces():
 
 def _create_event(event_soc, event25, date):
     if event_soc:
-        start_time = dateutil.parser.parse(event_soc["start"])
-        start_time = datetime(date.year, date.month, date.day, start_time.hour, start_time.minute, start_time.second)
-        end_time = dateutil.parser.parse(event_soc["end"])
-        end_time = datetime(date.year, date.month, date.day, end_time.hour, end_time.minute, end_time.second)
+        midnight = datetime(date.year, date.month, date.day)
+        start_time = midnight + timedelta(seconds=event_soc["start_seconds"])
+        end_time = midnight + timedelta(seconds=event_soc["end_seconds"])
 
         if event25:
             start_time = min(start_time, event25["start"])
@@ -452,75 +722,531 @@ def _create_event(event_soc, event25, date):
 
     return event
 
-def get_space_events(space, soc_timings, date, course_names={}):
+def _events25_for_day(events25, date):
+    # Reservations fetched for a longer range, keep only those overlapping this day
+    day_start = datetime(date.year, date.month, date.day)
+    day_end = day_start + timedelta(days=1)
+    return [x for x in events25 if x["start"] < day_end and x["end"] > day_start]
+
+def _fingerprint_space_day(space, soc_timings, date, events25):
+    events_soc = soc_timings[date.isoweekday() % 7].get(space["location"], [])
+    return hashlib.sha1(repr((space, events_soc, _events25_for_day(events25, date))).encode()).hexdigest()
+
+def _take_matches(items, starts, used, start, end):
+    """
+    Marks as used and returns the positions of all unused items whose start and end are both within
+    MERGE_TOLERANCE_SECONDS of (start, end). `items` are (start, end, ...) tuples sorted by start, and
+    `starts` holds their start times.
+    """
+    lo = bisect.bisect_left(starts, start - MERGE_TOLERANCE_SECONDS)
+    hi = bisect.bisect_right(starts, start + MERGE_TOLERANCE_SECONDS)
+
+    out = []
+    for i in range(lo, hi):
+        if not used[i] and abs(items[i][1] - end) <= MERGE_TOLERANCE_SECONDS:
+            used[i] = True
+            out.append(i)
+
+    return out
+
+@profiling.timed("merge events")
+def get_space_events(space, soc_timings, date, course_names={}, events25=None):
     day_of_week = date.isoweekday() % 7
+    midnight = datetime(date.year, date.month, date.day)
 
-    if space["25live_id"]:
-        events25 = copy.deepcopy(get_25live_timings_for_space(space["25live_id"], date, course_names))
+    if events25 is not None:
+        events25 = _events25_for_day(events25, date)
+    elif space["25live_id"]:
+        events25 = get_25live_timings_for_space(space["25live_id"], date, course_names)
     else:
         events25 = []
 
-    if space["location"] in soc_timings[day_of_week]:
-        events_soc = copy.deepcopy(soc_timings[day_of_week][space["location"]])
-    else:
-        events_soc = []
+    events_soc = soc_timings[day_of_week].get(space["location"], [])
 
-    events = []
+    # Both lists are sorted by start time (in seconds after midnight) so that events within the merge
+    # tolerance of each other can be found by binary search, but are still visited in their original
+    # order so that the first of a group of duplicates is the one kept
+    items_soc = sorted((x["start_seconds"], x["end_seconds"], i) for i, x in enumerate(events_soc))
+    items25 = sorted((int((x["start"] - midnight).total_seconds()), int((x["end"] - midnight).total_seconds()), i) for i, x in enumerate(events25))
+
+    starts_soc = [x[0] for x in items_soc]
+    starts25 = [x[0] for x in items25]
+    used_soc = [False] * len(items_soc)
+    used25 = [False] * len(items25)
 
-    for event_soc in events_soc[:]:
+    events = []
 
-        # Allows for deletion while iterating
-        if event_soc not in events_soc:
+    for i in sorted(range(len(items_soc)), key=lambda i: items_soc[i][2]):
+        if used_soc[i]:
             continue
 
-        start_time = dateutil.parser.parse(event_soc["start"])
-        start_time = datetime(date.year, date.month, date.day, start_time.hour, start_time.minute, start_time.second)
-        end_time = dateutil.parser.parse(event_soc["end"])
-        end_time = datetime(date.year, date.month, date.day, end_time.hour, end_time.minute, end_time.second)
+        start, end, index = items_soc[i]
 
-        e25 = [x for x in events25 if abs((x["start"] - start_time).seconds) <= 300 and abs((x["end"] - end_time).seconds) <= 300]
-        for x in e25: events25.remove(x)
+        # Repeats of the same section (e.g. cross-listed courses) are merged into one event
+        _take_matches(items_soc, starts_soc, used_soc, start, end)
 
-        if len(e25) > 0:
-            e25 = e25[0]
-        else:
-            e25 = None
+        e25 = _take_matches(items25, starts25, used25, start, end)
+        e25 = events25[min(items25[x][2] for x in e25)] if len(e25) > 0 else None
 
-        soc_repeats = [x for x in events_soc if abs((dateutil.parser.parse(x["start"]) - start_time).seconds) <= 300 and abs((dateutil.parser.parse(x["end"]) - end_time).seconds) <= 300]
-        for x in soc_repeats: events_soc.remove(x)
+        events.append(_create_event(events_soc[index], e25, date))
 
-        events.append(_create_event(event_soc, e25, date))
-
-    for event in events25[:]:
-        # Allows for deletion while iterating
-        if event not in events25:
+    for i in sorted(range(len(items25)), key=lambda i: items25[i][2]):
+        if used25[i]:
             continue
 
-        e25 = [x for x in events25 if abs((x["start"] - event["start"]).seconds) <= 300 and abs((x["end"] - event["end"]).seconds) <= 300]
-        for x in e25: events25.remove(x)
+        start, end, index = items25[i]
+        _take_matches(items25, starts25, used25, start, end)
 
-        events.append(_create_event(None, event, date))
+        events.append(_create_event(None, events25[index], date))
 
     return events
 
+def get_space_events_range(space, soc_timings, dates, course_names={}, previous=None, events25=None):
+    """
+    Returns {date: (fingerprint, event rows)} for the space, with events as store.event_rows()
+    tuples. If `previous` maps (date, location) to the fingerprint of an earlier update, days
+    whose fingerprint is unchanged are skipped and returned with rows set to None. The space's
+    25Live reservations over the dates are downloaded unless given as `events25`.
+    """
+    if events25 is not None:
+        pass
+    elif space["25live_id"]:
+        events25 = get_25live_timings_for_space(space["25live_id"], dates[0], course_names,
+                                                end_date=dates[-1], refresh=previous is not None)
+    else:
+        events25 = []
 
-def get_all_events(spaces, soc_timings, date, course_names={}):
-    return {space["location"]: get_space_events(space, soc_timings, date, course_names) for space in tqdm(spaces)}
-
-if len(sys.argv) < 2:
-    print(f"Usage: {sys.argv[0]} <date>")
-    sys.exit(1)
-else:
-    date = dateutil.parser.parse(sys.argv[1])
+    out = {}
+    for date in dates:
+        dt = date.strftime("%Y-%m-%d")
+        fingerprint = _fingerprint_space_day(space, soc_timings, date, events25)
 
-spaces = get_all_spaces()
-soc_timings, _ = get_all_soc_timings()
-course_names = get_all_soc_course_names()
+        if previous and previous.get((dt, space["location"])) == fingerprint:
+            out[dt] = (fingerprint, None)
+        else:
+            out[dt] = (fingerprint, store.event_rows(dt, get_space_events(space, soc_timings, date, course_names, events25)))
 
-all_events = get_all_events(spaces, soc_timings, date, course_names)
+    return out
 
-with open("spaces.pkl", "wb+") as f:
-    pickle.dump(spaces, f)
+def _build_events(batch, soc_timings, course_names, dates, previous):
+    """Builds get_space_events_range() for each (space, rm_reservations response or None) of the batch"""
+    out = []
+    for space, data in batch:
+        events25 = _parse_25live_timings(space["25live_id"], data, course_names) if data is not None else []
+        out.append(get_space_events_range(space, soc_timings, dates, course_names, previous, events25))
+    return out
 
-with open(f"events-{date.strftime('%Y-%m-%d')}.pkl", "wb+") as f:
-    pickle.dump(all_events, f)
+# Arguments of _build_events shared by every batch, set once in each worker process
+_process_args = None
+
+def _init_process(*args):
+    global _process_args
+    _process_args = args
+
+def _build_events_in_process(batch):
+    return _build_events(batch, *_process_args)
+
+def _iter_reservations(spaces, dates, workers, refresh):
+    """Yields (space, rm_reservations response or None if it has no 25Live id) as the downloads finish"""
+    def fetch(space):
+        if not space["25live_id"]:
+            return None
+
+        waited = [0.0]
+        _RATE_LIMIT_WAIT.set(waited)
+        start = time.perf_counter()
+        data = req_25live_endpoint(_reservations_url(space["25live_id"], dates[0], dates[-1]), refresh=refresh)
+        profiling.sample("reservations per space", time.perf_counter() - start - waited[0])
+        return data
+
+    if workers <= 1:
+        for space in spaces:
+            yield space, fetch(space)
+        return
+
+    spaces = iter(spaces)
+    pending = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        try:
+            while True:
+                for space in spaces:
+                    pending[pool.submit(fetch, space)] = space
+                    if len(pending) >= workers * 4:
+                        break
+
+                if len(pending) == 0:
+                    return
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield pending.pop(future), future.result()
+        finally:
+            # Don't start the rest if the caller stopped early
+            for future in pending:
+                future.cancel()
+
+def _batches(items, size):
+    batch = []
+    for x in items:
+        batch.append(x)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if len(batch) > 0:
+        yield batch
+
+def iter_events_range(spaces, soc_timings, start_date, end_date, course_names={}, workers=FETCH_WORKERS, previous=None,
+                      use_async=FETCH_ASYNC, processes=PROCESS_WORKERS, refresh=False):
+    """
+    Yields (space, {date: (fingerprint, event rows)}) as each space finishes, in no particular
+    order. Reservations are downloaded by `workers` threads (or the asyncio client with
+    `use_async`), and events are built from them in batches by `processes` worker processes.
+    Only a few spaces per worker are in flight at once, so memory use does not grow with the
+    number of spaces as long as the caller does not hold on to the results. Cached responses
+    are used unless `refresh` is set or this is an incremental update (`previous`).
+    """
+    refresh = refresh or previous is not None
+    dates = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+
+    if use_async:
+        downloads = _iter_reservations_async(spaces, dates, refresh)
+    else:
+        downloads = _iter_reservations(spaces, dates, workers, refresh)
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    try:
+        if processes <= 1:
+            for batch in _batches(downloads, PROCESS_BATCH_SIZE):
+                yield from zip((space for space, _ in batch), _build_events(batch, soc_timings, course_names, dates, previous))
+            return
+
+        # Workers are started while download threads hold locks (urllib3 pools, the response cache,
+        # profiling), which a forked child could inherit in the locked state
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+        batches = _batches(downloads, PROCESS_BATCH_SIZE)
+        pending = {}
+        with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context(method),
+                                 initializer=_init_process, initargs=(soc_timings, course_names, dates, previous)) as pool:
+            try:
+                while True:
+                    for batch in batches:
+                        pending[pool.submit(_build_events_in_process, batch)] = [space for space, _ in batch]
+                        if len(pending) >= processes * 2:
+                            break
+
+                    if len(pending) == 0:
+                        return
+
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield from zip(pending.pop(future), future.result())
+            finally:
+                for future in pending:
+                    future.cancel()
+    finally:
+        # Stops the downloads if the caller stopped early
+        downloads.close()
+
+async def _fetch_reservations_async(spaces, dates, refresh, out):
+    semaphore = asyncio.Semaphore(FETCH_ASYNC_CONCURRENCY)
+    loop = asyncio.get_running_loop()
+
+    if SESSION_25LIVE is None:
+        await loop.run_in_executor(None, login)
+
+    async with make_async_session(COOKIES_25LIVE) as session:
+        async def fetch(space):
+            data = None
+            if space["25live_id"]:
+                async with semaphore:
+                    # Each task runs in its own copy of the context
+                    waited = [0.0]
+                    _RATE_LIMIT_WAIT.set(waited)
+                    start = time.perf_counter()
+                    data = await req_25live_endpoint_async(session, _reservations_url(space["25live_id"], dates[0], dates[-1]),
+                                                           refresh=refresh)
+                    profiling.sample("reservations per space", time.perf_counter() - start - waited[0])
+
+            # Blocks while the consumer is behind
+            await loop.run_in_executor(None, out.put, (space, data, None))
+
+        tasks = [asyncio.ensure_future(fetch(space)) for space in spaces]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # Stop the other downloads before the session closes
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+def _iter_reservations_async(spaces, dates, refresh):
+    """
+    Same as _iter_reservations, with the downloads running on an event loop in a background
+    thread. They are cancelled if the caller stops early.
+    """
+    out = queue.Queue(maxsize=FETCH_ASYNC_CONCURRENCY)
+    loop = asyncio.new_event_loop()
+    task = loop.create_task(_fetch_reservations_async(spaces, dates, refresh, out))
+
+    def run():
+        try:
+            loop.run_until_complete(task)
+        except BaseException as e:
+            out.put((None, None, e))
+        finally:
+            loop.run_until_complete(loop.shutdown_default_executor())
+            loop.close()
+            out.put(None)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            item = out.get()
+            if item is None:
+                return
+
+            space, data, error = item
+            if error is not None:
+                raise error
+
+            yield space, data
+    finally:
+        if thread.is_alive():
+            loop.call_soon_threadsafe(task.cancel)
+
+            # Unblock downloads waiting for room in the queue until the loop has shut down
+            while thread.is_alive():
+                try:
+                    out.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+
+def get_all_events_range(spaces, soc_timings, start_date, end_date, course_names={}, workers=FETCH_WORKERS, previous=None,
+                         use_async=FETCH_ASYNC, processes=PROCESS_WORKERS):
+    dates = [(start_date + timedelta(days=i)).strftime("%Y-%m-%d") for i in range((end_date - start_date).days + 1)]
+
+    from tqdm import tqdm
+
+    results = {}
+    for space, events in tqdm(iter_events_range(spaces, soc_timings, start_date, end_date, course_names, workers, previous,
+                                                use_async, processes), total=len(spaces)):
+        results[space["location"]] = events
+
+    # Keep the same ordering as the spaces list
+    return {date: {space["location"]: results[space["location"]][date] for space in spaces} for date in dates}
+
+def get_all_events(spaces, soc_timings, date, course_names={}, workers=FETCH_WORKERS, processes=PROCESS_WORKERS):
+    """Returns {location: event rows} for the date"""
+    events = get_all_events_range(spaces, soc_timings, date, date, course_names, workers, processes=processes)[date.strftime("%Y-%m-%d")]
+    return {location: x[1] for location, x in events.items()}
+
+def _checkpoint_records(f):
+    """Yields (offset after the record, record) from an open checkpoint, stopping at a truncated record"""
+    while True:
+        try:
+            record = pickle.load(f)
+        except (EOFError, pickle.UnpicklingError, ValueError):
+            return
+        yield f.tell(), record
+
+def _open_checkpoint(header):
+    """
+    Opens the update checkpoint for appending. A checkpoint starts with a header record (the
+    update's dates and mode, and its spaces) followed by one (location, events) record per
+    completed space. Returns (file, spaces, completed locations); spaces is None, and the file
+    is started over, if there is no checkpoint of an update with the same header.
+    """
+    if os.path.exists(UPDATE_CHECKPOINT):
+        f = open(UPDATE_CHECKPOINT, "r+b")
+        records = _checkpoint_records(f)
+        first = next(records, None)
+
+        if first is not None and first[1]["dates"] == header["dates"] and first[1]["incremental"] == header["incremental"]:
+            offset = first[0]
+            completed = set()
+            for offset, (location, _) in records:
+                completed.add(location)
+
+            # Drop anything after the last complete record, left behind by a crash
+            f.seek(offset)
+            f.truncate()
+            return f, first[1]["spaces"], completed
+
+        f.close()
+
+    f = open(UPDATE_CHECKPOINT, "wb")
+    return f, None, set()
+
+def tqdm_progress():
+    """Progress callback for run_update that shows a tqdm bar for each stage"""
+    from tqdm import tqdm
+
+    bars = {}
+    def progress(stage, done, total):
+        if stage not in bars:
+            bars[stage] = tqdm(total=total, desc=stage)
+        bars[stage].update(done - bars[stage].n)
+        if done >= total:
+            bars[stage].close()
+    return progress
+
+def run_update(start_date, end_date=None, incremental=False, restart=False, use_async=FETCH_ASYNC,
+               processes=PROCESS_WORKERS, progress=None, refresh=False):
+    """
+    Downloads the spaces and the events of the dates from `start_date` to `end_date` (datetimes,
+    inclusive) and stores them, see README.txt for the options. `progress(stage, done, total)`
+    is called as spaces are processed. Returns {"changed": room-days rebuilt, "total": room-days,
+    "timings": {stage: seconds}}, and raises UpdateError if the update cannot be done.
+    """
+    end_date = end_date or start_date
+    if end_date < start_date:
+        raise UpdateError(f"Invalid date range {start_date:%Y-%m-%d} - {end_date:%Y-%m-%d}")
+
+    dates = [(start_date + timedelta(days=i)).strftime("%Y-%m-%d") for i in range((end_date - start_date).days + 1)]
+    timings = {}
+
+    def stage(name, start):
+        now = time.perf_counter()
+        timings[name] = timings.get(name, 0) + now - start
+        if profiling.enabled:
+            profiling.add_time(f"update {name}", now - start)
+        return now
+
+    checkpoint = conn = remaining = None
+    spaces, completed = None, set()
+    t = time.perf_counter()
+    try:
+        login()
+        prune_cache()
+        t = stage("login", t)
+
+        if restart and os.path.exists(UPDATE_CHECKPOINT):
+            os.remove(UPDATE_CHECKPOINT)
+
+        header = {"dates": dates, "incremental": incremental}
+        checkpoint, spaces, completed = _open_checkpoint(header)
+        conn = store.connect()
+
+        previous = None
+        if spaces is not None:
+            print(f"Resuming update, {len(completed)} of {len(spaces)} spaces already done")
+            if incremental:
+                previous = store.load_fingerprints(conn, dates)
+
+        elif incremental:
+            try:
+                with open("spaces.pkl", "rb") as f:
+                    spaces = pickle.load(f)
+            except (OSError, pickle.UnpicklingError, EOFError):
+                print("No previous spaces found, doing a full update")
+            else:
+                previous = store.load_fingerprints(conn, dates)
+
+        if spaces is None:
+            spaces = get_all_spaces(refresh)
+
+        if checkpoint.tell() == 0:
+            pickle.dump(dict(header, spaces=spaces), checkpoint)
+            checkpoint.flush()
+
+        t = stage("spaces", t)
+
+        soc_timings, _ = get_all_soc_timings()
+        course_names = get_all_soc_course_names()
+        t = stage("soc", t)
+
+        # Each space is written to the checkpoint as soon as it is done, so an interrupted update
+        # (expired cookie, network failure, ^C) can pick up where it left off
+        remaining = [space for space in spaces if space["location"] not in completed]
+        for i, (space, events) in enumerate(iter_events_range(remaining, soc_timings, start_date, end_date, course_names,
+                                                              previous=previous, use_async=use_async, processes=processes,
+                                                              refresh=refresh)):
+            pickle.dump((space["location"], events), checkpoint)
+            checkpoint.flush()
+            completed.add(space["location"])
+            if progress:
+                progress("events", i + 1, len(remaining))
+    except (Exception, KeyboardInterrupt) as e:
+        if checkpoint is not None:
+            # A checkpoint without even the header record is of no use to the next run
+            empty = checkpoint.tell() == 0
+            checkpoint.close()
+            if empty:
+                os.remove(UPDATE_CHECKPOINT)
+        if conn is not None:
+            conn.close()
+
+        if remaining is None:
+            if isinstance(e, UpdateError):
+                raise
+            raise UpdateError(f"Update failed before downloading events: {e!r}") from e
+        raise UpdateError(f"Update stopped after {len(completed)} of {len(spaces)} spaces: {e!r}\n"
+                          "Run the same update again to resume it") from e
+
+    checkpoint.close()
+    t = stage("events", t)
+
+    # Publish everything in one transaction, so that readers see either the old or the new events
+    changed = 0
+    total = 0
+    with open(UPDATE_CHECKPOINT, "rb") as f, conn:
+        records = _checkpoint_records(f)
+        next(records)
+
+        if previous is None:
+            for date in dates:
+                store.clear_date(conn, date)
+
+        for _, (location, events) in records:
+            for date, (fingerprint, rows) in events.items():
+                total += 1
+                if rows is not None:
+                    changed += 1
+                    store.save_room_rows(conn, date, location, rows, fingerprint)
+
+    conn.close()
+
+    store.write_pickle("spaces.pkl", spaces)
+    store.write_pickle(store.SPACE_INDEX_FILE, store.build_space_index(spaces, store.file_stamp("spaces.pkl")))
+    os.remove(UPDATE_CHECKPOINT)
+    stage("publish", t)
+
+    return {"changed": changed if previous is not None else total, "total": total, "timings": timings}
+
+def main():
+    parser = argparse.ArgumentParser(description="Download spaces and events from 25Live and SOC")
+    parser.add_argument("date", help="first date to download (YYYY-MM-DD)")
+    parser.add_argument("end_date", nargs="?", default=None, help="last date to download, inclusive (defaults to DATE)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="reuse the previous spaces list and only rebuild rooms whose reservations changed")
+    parser.add_argument("--restart", action="store_true",
+                        help="start over instead of resuming an interrupted update of the same dates")
+    parser.add_argument("--async", dest="use_async", action="store_true", default=FETCH_ASYNC,
+                        help="download reservations with the asyncio client (needs aiohttp)")
+    parser.add_argument("--refresh", action="store_true",
+                        help="download everything again instead of using cached 25Live responses")
+    parser.add_argument("--processes", type=int, default=PROCESS_WORKERS,
+                        help=f"processes building events from the downloaded reservations (default {PROCESS_WORKERS})")
+    args = parser.parse_args()
+
+    start_date = dateutil.parser.parse(args.date)
+    end_date = dateutil.parser.parse(args.end_date) if args.end_date else start_date
+
+    try:
+        result = run_update(start_date, end_date, args.incremental, args.restart, args.use_async, args.processes,
+                            progress=tqdm_progress(), refresh=args.refresh)
+    except UpdateError as e:
+        print(e)
+        sys.exit(1)
+
+    if args.incremental:
+        print(f"{result['changed']} of {result['total']} room-days changed")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import functools
+import sys
+import threading
+import time
+
+# Lightweight instrumentation behind `cmuroom --timings`. Everything here is a no-op until
+# enable() is called, so the hooks can stay in place on hot paths.
+
+enabled = False
+
+_lock = threading.Lock()
+_times = {} # name: [seconds, calls]
+_counts = {}
+_samples = {} # name: [seconds, ...]
+
+def enable():
+    global enabled
+    enabled = True
+
+def add_time(name, seconds):
+    with _lock:
+        entry = _times.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+def count(name, n=1):
+    if enabled:
+        with _lock:
+            _counts[name] = _counts.get(name, 0) + n
+
+def sample(name, seconds):
+    """Records one latency measurement, reported as percentiles"""
+    if enabled:
+        with _lock:
+            _samples.setdefault(name, []).append(seconds)
+
+def timed(name):
+    """Decorator that adds the wall time of each call to the named stage"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return fn(*args, **kwargs)
+
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                add_time(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+def percentile(values, p):
+    """Nearest-rank percentile of sorted `values`"""
+    return values[min(len(values) - 1, max(0, int(round(p / 100 * len(values))) - 1))]
+
+def report(file=sys.stderr):
+    with _lock:
+        times = dict(_times)
+        counts = dict(_counts)
+        samples = {name: sorted(x) for name, x in _samples.items()}
+
+    print("Timings:", file=file)
+    for name, (seconds, calls) in times.items():
+        print(f"  {name.ljust(24)} {seconds:9.4f}s" + (f"  ({calls} calls)" if calls > 1 else ""), file=file)
+
+    for name, n in counts.items():
+        print(f"  {name.ljust(24)} {n:9d}", file=file)
+
+    for name, values in samples.items():
+        ms = {p: percentile(values, p) * 1000 for p in [50, 90, 99]}
+        print(f"  {name.ljust(24)} p50 {ms[50]:.1f}ms  p90 {ms[90]:.1f}ms  p99 {ms[99]:.1f}ms  "
+              f"max {values[-1] * 1000:.1f}ms  ({len(values)} samples)", file=file)
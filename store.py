@@ -0,0 +1,402 @@
+import bisect
+import os
+import sys
+from array import array
+from datetime import datetime, timedelta
+
+# Events for every downloaded date, indexed by date and location
+EVENTS_DB = "events.db"
+
+# Lookup tables for finding a space by location or 25Live id, written alongside spaces.pkl
+SPACE_INDEX_FILE = "space_index.pkl"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    date TEXT NOT NULL,
+    location TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    end INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    status TEXT NOT NULL,
+    source TEXT NOT NULL,
+    comment TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_date_location ON events (date, location);
+
+CREATE TABLE IF NOT EXISTS rooms (
+    date TEXT NOT NULL,
+    location TEXT NOT NULL,
+    fingerprint TEXT,
+    PRIMARY KEY (date, location)
+);
+
+CREATE TABLE IF NOT EXISTS occupancy (
+    date TEXT NOT NULL,
+    location TEXT NOT NULL,
+    bits BLOB NOT NULL,
+    PRIMARY KEY (date, location)
+);
+
+CREATE TABLE IF NOT EXISTS free_intervals (
+    date TEXT NOT NULL,
+    location TEXT NOT NULL,
+    intervals BLOB NOT NULL,
+    PRIMARY KEY (date, location)
+);
+"""
+
+# The current or next free window of every room as of some minute of the day, kept up to date by
+# `cmuroom refresh`, the query daemon and `available` itself. Kept apart from EVENTS_DB so that
+# refreshing it does not invalidate snapshots of the events.
+FREE_NOW_DB = "free_now.db"
+
+FREE_NOW_SCHEMA = """
+CREATE TABLE IF NOT EXISTS free_now (
+    date TEXT NOT NULL,
+    location TEXT NOT NULL,
+    since INTEGER NOT NULL,
+    free_from INTEGER NOT NULL,
+    free_until INTEGER NOT NULL,
+    previous TEXT,
+    PRIMARY KEY (date, location)
+);
+CREATE INDEX IF NOT EXISTS free_now_free_until ON free_now (date, free_until);
+
+CREATE TABLE IF NOT EXISTS free_now_dates (
+    date TEXT PRIMARY KEY,
+    source REAL NOT NULL
+);
+"""
+
+MINUTES_PER_DAY = 24 * 60
+
+# Above this many locations it is cheaper to read the whole date than to build an IN (...) query
+MAX_QUERY_LOCATIONS = 200
+
+class Event:
+    """An event in a room, with start and end in minutes after midnight of its date"""
+    __slots__ = ("start", "end", "name", "status", "source", "comment")
+
+    def __init__(self, start, end, name, status, source, comment):
+        self.start = start
+        self.end = end
+        self.name = name
+        # Only a handful of distinct values, shared between all events
+        self.status = sys.intern(status)
+        self.source = sys.intern(source)
+        self.comment = comment
+
+    def to_dict(self):
+        return {x: getattr(self, x) for x in self.__slots__}
+
+class Block:
+    """A stretch of a room's day (see utils.events_to_blocks), either free or taken by `event`"""
+    __slots__ = ("start", "end", "available", "event")
+
+    def __init__(self, start, end, available, event=None):
+        self.start = start
+        self.end = end
+        self.available = available
+        self.event = event
+
+def connect(path=EVENTS_DB, schema=SCHEMA):
+    # Imported here to keep it off the CLI startup path
+    import sqlite3
+    conn = sqlite3.connect(path)
+    conn.executescript(schema)
+    return conn
+
+def _midnight(date):
+    return datetime.strptime(date, "%Y-%m-%d")
+
+def to_minutes(date, time):
+    """Minutes between midnight of `date` (YYYY-MM-DD) and the datetime `time`"""
+    return int((time - _midnight(date)).total_seconds() // 60)
+
+def from_minutes(date, minutes):
+    return _midnight(date) + timedelta(minutes=minutes)
+
+def event_rows(date, events):
+    """
+    Events of the date as compact (start, end, name, status, source, comment) tuples, with start
+    and end in minutes after midnight. This is how update passes events around and stores them.
+    """
+    return [(to_minutes(date, x["start"]), to_minutes(date, x["end"]), x["name"], x["status"], x["source"], x["comment"])
+            for x in events]
+
+def rows_to_bitmap(rows):
+    """
+    Occupancy of a room over the date as an integer where bit i is set if some event covers
+    minute i (i.e. [i, i+1) minutes after midnight). Events extending past either end of the
+    day are clipped to it.
+    """
+    bits = 0
+    for x in rows:
+        start = max(0, x[0])
+        end = min(MINUTES_PER_DAY, x[1])
+        if end > start:
+            bits |= ((1 << (end - start)) - 1) << start
+    return bits
+
+def range_mask(start, end):
+    """Bitmap selecting minutes [start, end)"""
+    return ((1 << (end - start)) - 1) << start if end > start else 0
+
+def free_interval(bits, minute):
+    """Returns (start, end) of the free interval containing `minute`, which must itself be free"""
+    free_from = (bits & ((1 << minute) - 1)).bit_length()
+    after = bits >> minute
+    free_until = minute + (after & -after).bit_length() - 1 if after else MINUTES_PER_DAY
+    return free_from, free_until
+
+def clear_date(conn, date):
+    conn.execute("DELETE FROM events WHERE date = ?", (date,))
+    conn.execute("DELETE FROM rooms WHERE date = ?", (date,))
+    conn.execute("DELETE FROM occupancy WHERE date = ?", (date,))
+    conn.execute("DELETE FROM free_intervals WHERE date = ?", (date,))
+
+def save_room_rows(conn, date, location, rows, fingerprint=None):
+    """Replaces the stored events of one room on the date with event_rows(), without committing"""
+    conn.execute("DELETE FROM events WHERE date = ? AND location = ?", (date, location))
+    conn.execute("INSERT OR REPLACE INTO rooms (date, location, fingerprint) VALUES (?, ?, ?)",
+                 (date, location, fingerprint))
+    conn.executemany("INSERT INTO events (date, location, start, end, name, status, source, comment) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                     [(date, location) + tuple(x) for x in rows])
+    bits = rows_to_bitmap(rows)
+    conn.execute("INSERT OR REPLACE INTO occupancy (date, location, bits) VALUES (?, ?, ?)",
+                 (date, location, bits.to_bytes(MINUTES_PER_DAY // 8, "little")))
+    conn.execute("INSERT OR REPLACE INTO free_intervals (date, location, intervals) VALUES (?, ?, ?)",
+                 (date, location, free_intervals(bits).tobytes()))
+
+def free_intervals(bits):
+    """
+    The free intervals of an occupancy bitmap as a flat array [start, end, start, end, ...] of
+    minutes, in order, where each interval is [start, end)
+    """
+    out = array("H")
+    minute = 0
+    while minute < MINUTES_PER_DAY:
+        after = bits >> minute
+        if after & 1:
+            # Skip to the end of the busy stretch
+            busy = ~after
+            minute += (busy & -busy).bit_length() - 1
+        else:
+            end = free_interval(bits, minute)[1]
+            out.extend((minute, end))
+            minute = end
+    return out
+
+def find_free_interval(intervals, minute):
+    """Returns (start, end) of the interval in free_intervals() containing `minute`, or None if it is busy"""
+    i = bisect.bisect_right(intervals, minute)
+    # An odd count of boundaries at or before the minute means it is inside an interval
+    if i % 2 == 1 and minute < intervals[i]:
+        return intervals[i - 1], intervals[i]
+    return None
+
+def next_free_interval(intervals, minute):
+    """
+    Returns (start, end) of the interval in free_intervals() containing `minute`, or else the first
+    one after it, or (MINUTES_PER_DAY, MINUTES_PER_DAY) if the room stays busy for the rest of the day
+    """
+    i = bisect.bisect_right(intervals, minute)
+    if i % 2 == 1:
+        return intervals[i - 1], intervals[i]
+    if i < len(intervals):
+        return intervals[i], intervals[i + 1]
+    return MINUTES_PER_DAY, MINUTES_PER_DAY
+
+def free_now_rows(minute, intervals, events):
+    """
+    free_now rows (location, since, free_from, free_until, previous) as of `minute`, from
+    {location: free_intervals()} and {location: [Event, ...]}. `previous` is the name of the event
+    ending at free_from, if any.
+    """
+    rows = []
+    for location, x in intervals.items():
+        free_from, free_until = next_free_interval(x, minute)
+
+        previous = None
+        if 0 < free_from < MINUTES_PER_DAY:
+            prev_events = [e for e in events.get(location, []) if min(e.end, MINUTES_PER_DAY) == free_from]
+            if len(prev_events) > 0:
+                previous = prev_events[-1].name
+
+        rows.append((location, minute, free_from, free_until, previous))
+    return rows
+
+def stale_free_now(conn, date, minute, source):
+    """
+    Locations whose free_now row is not valid at `minute`, i.e. was built after it or for a window
+    that has ended. None if the whole date needs building, because it never was or `source` (the
+    mtime of EVENTS_DB it was built from) changed since.
+    """
+    row = conn.execute("SELECT source FROM free_now_dates WHERE date = ?", (date,)).fetchone()
+    if row is None or row[0] != source:
+        return None
+
+    return [location for location, in conn.execute("SELECT location FROM free_now WHERE date = ? AND (since > ? OR free_until <= ?)",
+                                                   (date, minute, minute))]
+
+def save_free_now(conn, date, source, rows, replace=False):
+    """Stores free_now_rows() for the date, dropping the other rooms of the date if `replace` is set"""
+    with conn:
+        if replace:
+            conn.execute("DELETE FROM free_now WHERE date = ?", (date,))
+
+        conn.executemany("INSERT OR REPLACE INTO free_now (date, location, since, free_from, free_until, previous) VALUES (?, ?, ?, ?, ?, ?)",
+                         [(date,) + tuple(x) for x in rows])
+        conn.execute("INSERT OR REPLACE INTO free_now_dates (date, source) VALUES (?, ?)", (date, source))
+
+def load_free_now(conn, date, start, end):
+    """
+    (location, free_from, free_until, previous) of the rooms free from minute `start` to `end`,
+    longest free first. Only correct once stale_free_now() of `start` is empty.
+    """
+    return conn.execute("SELECT location, free_from, free_until, previous FROM free_now "
+                        "WHERE date = ? AND free_until > ? AND free_until >= ? AND free_from <= ? ORDER BY free_until DESC, location",
+                        (date, start, end, start)).fetchall()
+
+def next_free_now_change(conn, date, minute):
+    """The next minute after `minute` at which a free_now row of the date goes stale, or None"""
+    return conn.execute("SELECT MIN(free_until) FROM free_now WHERE date = ? AND free_until > ?", (date, minute)).fetchone()[0]
+
+def save_events(conn, date, events, fingerprints={}, replace=False):
+    """
+    Stores {location: event_rows()} for the date. Locations not in `events` are left untouched
+    unless `replace` is set, in which case everything previously stored for the date is dropped.
+    """
+    with conn:
+        if replace:
+            clear_date(conn, date)
+
+        for location, rows in events.items():
+            save_room_rows(conn, date, location, rows, fingerprints.get(location))
+
+def write_pickle(path, obj):
+    """Pickles to a temporary file and renames it over `path`, so readers never see a partial file"""
+    import pickle
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(obj, f)
+    os.replace(tmp_path, path)
+
+def load_events(conn, date, locations=None):
+    """Returns {location: [Event, ...]} for the date (restricted to `locations` if given), or None if the date was never stored"""
+    if locations is not None and len(locations) <= MAX_QUERY_LOCATIONS:
+        locations = list(locations)
+        where = f"date = ? AND location IN ({','.join('?' * len(locations))})"
+        params = [date] + locations
+    else:
+        where = "date = ?"
+        params = [date]
+
+    rooms = conn.execute(f"SELECT location FROM rooms WHERE {where}", params).fetchall()
+    if len(rooms) == 0 and conn.execute("SELECT 1 FROM rooms WHERE date = ? LIMIT 1", (date,)).fetchone() is None:
+        return None
+
+    events = {location: [] for location, in rooms}
+    rows = conn.execute(f"SELECT location, start, end, name, status, source, comment FROM events WHERE {where} ORDER BY rowid", params)
+    for location, *row in rows:
+        events[location].append(Event(*row))
+
+    return events
+
+def load_occupancy(conn, date, locations=None):
+    """Returns {location: occupancy bitmap} for the date (restricted to `locations` if given), or None if the date was never stored"""
+    if locations is not None and len(locations) <= MAX_QUERY_LOCATIONS:
+        locations = list(locations)
+        rows = conn.execute(f"SELECT location, bits FROM occupancy WHERE date = ? AND location IN ({','.join('?' * len(locations))})",
+                            [date] + locations).fetchall()
+    else:
+        rows = conn.execute("SELECT location, bits FROM occupancy WHERE date = ?", (date,)).fetchall()
+
+    if len(rows) == 0 and conn.execute("SELECT 1 FROM occupancy WHERE date = ? LIMIT 1", (date,)).fetchone() is None:
+        return None
+
+    return {location: int.from_bytes(bits, "little") for location, bits in rows}
+
+def load_free_intervals(conn, date, locations=None):
+    """
+    Returns {location: free_intervals() array} for the date (restricted to `locations` if given),
+    or None if the date was stored without them
+    """
+    if locations is not None and len(locations) <= MAX_QUERY_LOCATIONS:
+        locations = list(locations)
+        rows = conn.execute(f"SELECT location, intervals FROM free_intervals WHERE date = ? AND location IN ({','.join('?' * len(locations))})",
+                            [date] + locations).fetchall()
+    else:
+        rows = conn.execute("SELECT location, intervals FROM free_intervals WHERE date = ?", (date,)).fetchall()
+
+    if len(rows) == 0 and conn.execute("SELECT 1 FROM free_intervals WHERE date = ? LIMIT 1", (date,)).fetchone() is None:
+        return None
+
+    out = {}
+    for location, intervals in rows:
+        out[location] = array("H")
+        out[location].frombytes(intervals)
+    return out
+
+def load_occupancy_dates(conn, dates, locations=None):
+    """Returns {date: {location: occupancy bitmap}} for those of the dates that were stored, in one query"""
+    dates = list(dates)
+    query = f"SELECT date, location, bits FROM occupancy WHERE date IN ({','.join('?' * len(dates))})"
+    args = dates
+
+    if locations is not None and len(locations) <= MAX_QUERY_LOCATIONS:
+        query += f" AND location IN ({','.join('?' * len(locations))})"
+        args = dates + list(locations)
+
+    out = {}
+    for date, location, bits in conn.execute(query, args):
+        out.setdefault(date, {})[location] = int.from_bytes(bits, "little")
+    return out
+
+def load_fingerprints(conn, dates):
+    """Returns {(date, location): fingerprint} for the given dates"""
+    out = {}
+    for date in dates:
+        rows = conn.execute("SELECT location, fingerprint FROM rooms WHERE date = ? AND fingerprint IS NOT NULL", (date,))
+        out.update({(date, location): fingerprint for location, fingerprint in rows})
+    return out
+
+def normalize_location(location):
+    return location.lower().replace(" ", "")
+
+def file_stamp(path):
+    """(mtime, size) of the file, to tell whether it was rewritten"""
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+def build_space_index(spaces, spaces_stamp=None):
+    """
+    Maps normalized location -> [positions in spaces] and 25Live id -> position, plus the sorted
+    normalized locations for prefix lookups. `spaces_stamp` is the file_stamp() of the spaces.pkl
+    holding `spaces`, which the index is only used with.
+    """
+    locations = {}
+    ids = {}
+    for i, space in enumerate(spaces):
+        locations.setdefault(normalize_location(space["location"]), []).append(i)
+        if space["25live_id"] is not None:
+            ids.setdefault(space["25live_id"], i)
+
+    return {
+        "spaces_stamp": spaces_stamp,
+        "count": len(spaces),
+        "locations": locations,
+        "25live_ids": ids,
+        "keys": sorted(locations)
+    }
+
+def prefix_matches(index, prefix):
+    """Normalized locations starting with the normalized prefix"""
+    prefix = normalize_location(prefix)
+    keys = index["keys"]
+    i = bisect.bisect_left(keys, prefix)
+    out = []
+    while i < len(keys) and keys[i].startswith(prefix):
+        out.append(keys[i])
+        i += 1
+    return out
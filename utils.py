@@ -1,24 +1,253 @@
 import click
+import os
 import sys
-import pickle
-import dateutil.parser
-from datetime import datetime
+from datetime import datetime, timedelta
 from config import *
+import store
+import profiling
 
-def load_events(date):
+class QueryError(Exception):
+    """A query that cannot be answered, e.g. because of an invalid room or missing data"""
+
+# Snapshots loaded by the query daemon are kept here between requests, keyed by what was loaded and
+# invalidated when the underlying file changes. None for one-off CLI invocations.
+_snapshot_cache = None
+
+def enable_snapshot_cache():
+    global _snapshot_cache
+    _snapshot_cache = {}
+
+# Files that even one-off invocations read more than once (e.g. spaces.pkl for both find_space and the
+# space index) are kept here when there is no snapshot cache
+_process_cache = {}
+
+def _cached(key, path, load, per_process=False):
+    cache = _snapshot_cache
+    if cache is None:
+        if not per_process:
+            return load()
+        cache = _process_cache
+
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        mtime = None
+
+    if key not in cache or cache[key][0] != mtime:
+        cache[key] = (mtime, load())
+
+    return cache[key][1]
+
+@profiling.timed("load spaces")
+def _load_spaces():
+    import pickle
+    try:
+        with open("spaces.pkl", "rb") as f:
+            return pickle.load(f)
+    except:
+        return []
+
+def load_spaces():
+    return _cached("spaces", "spaces.pkl", _load_spaces, per_process=True)
+
+@profiling.timed("load space index")
+def _load_space_index():
+    import pickle
+    spaces = load_spaces()
+    try:
+        with open(store.SPACE_INDEX_FILE, "rb") as f:
+            index = pickle.load(f)
+    except:
+        index = None
+
+    try:
+        stamp = store.file_stamp("spaces.pkl")
+    except OSError:
+        stamp = None
+
+    # The index may be from older versions, or from before spaces.pkl was last written
+    if index is None or stamp is None or index.get("spaces_stamp") != stamp or index["count"] != len(spaces):
+        index = store.build_space_index(spaces, stamp)
+
+    return index
+
+def load_space_index():
+    # Goes with the spaces rather than with the index file
+    return _cached("space_index", "spaces.pkl", _load_space_index, per_process=True)
+
+def find_space(location):
+    """
+    Looks up a space by index, location (ignoring case and spaces), "25live:ID", or failing those a
+    unique location prefix. Close matches are only suggested in the QueryError.
+    """
+    import difflib
+
+    spaces = load_spaces()
+    index = load_space_index()
+
+    if location.isdigit() and int(location) < len(spaces):
+        return spaces[int(location)]
+
+    if location.lower().startswith("25live:") and location[7:].strip().isdigit():
+        i = index["25live_ids"].get(int(location[7:]))
+        if i is None:
+            raise QueryError(f"No room with 25Live id {location[7:].strip()}")
+        return spaces[i]
+
+    key = store.normalize_location(location)
+    matches = index["locations"].get(key, [])
+    if len(matches) == 1:
+        return spaces[matches[0]]
+    elif len(matches) > 1:
+        raise QueryError(f"Invalid location '{location}' - matches {len(matches)} rooms")
+
+    candidates = store.prefix_matches(index, key)
+    if len(candidates) == 1 and len(index["locations"][candidates[0]]) == 1:
+        return spaces[index["locations"][candidates[0]][0]]
+
+    if len(candidates) == 0:
+        candidates = difflib.get_close_matches(key, index["keys"], n=5, cutoff=0.8)
+
+    if len(candidates) > 0:
+        names = [spaces[index["locations"][x][0]]["location"] for x in candidates[:10]]
+        raise QueryError(f"Invalid location '{location}' - did you mean: {', '.join(names)}")
+
+    raise QueryError(f"Invalid location '{location}'")
+
+@profiling.timed("load events")
+def _load_events(date, locations):
+    try:
+        conn = store.connect()
+        events = store.load_events(conn, date, locations)
+        conn.close()
+    except:
+        events = None
+
+    if events is not None:
+        return events
+
+    # Fall back to the per-date pickles written by older versions
+    import pickle
     try:
         with open(f"events-{date}.pkl", "rb") as f:
             events = pickle.load(f)
-        return events
+        return {location: [store.Event(*row) for row in store.event_rows(date, x)] for location, x in events.items()}
 
     except:
-        click.echo(f"Events not downloaded for date '{date}'. Run `update` command to download.")
-        sys.exit(1)
+        raise QueryError(f"Events not downloaded for date '{date}'. Run `update` command to download.")
+
+def load_events(date, locations=None):
+    # The daemon keeps whole dates in memory, so it ignores `locations`
+    if _snapshot_cache is not None:
+        return _cached(("events", date), store.EVENTS_DB, lambda: _load_events(date, None))
+    return _load_events(date, locations)
+
+@profiling.timed("load occupancy")
+def _load_occupancy(date, locations):
+    try:
+        conn = store.connect()
+        occupancy = store.load_occupancy(conn, date, locations)
+        conn.close()
+    except:
+        occupancy = None
+
+    if occupancy is not None:
+        return occupancy
+
+    # Dates downloaded by older versions have no precomputed bitmaps
+    events = _load_events(date, locations)
+    return {location: store.rows_to_bitmap((e.start, e.end) for e in x) for location, x in events.items()}
+
+def load_occupancy(date, locations=None):
+    if _snapshot_cache is not None:
+        return _cached(("occupancy", date), store.EVENTS_DB, lambda: _load_occupancy(date, None))
+    return _load_occupancy(date, locations)
+
+@profiling.timed("load free intervals")
+def _load_free_intervals(date, locations):
+    try:
+        conn = store.connect()
+        intervals = store.load_free_intervals(conn, date, locations)
+        conn.close()
+    except:
+        intervals = None
+
+    if intervals is not None:
+        return intervals
+
+    # Dates downloaded by older versions only have bitmaps, or only events
+    return {location: store.free_intervals(bits) for location, bits in _load_occupancy(date, locations).items()}
+
+def load_free_intervals(date, locations=None):
+    if _snapshot_cache is not None:
+        return _cached(("free_intervals", date), store.EVENTS_DB, lambda: _load_free_intervals(date, None))
+    return _load_free_intervals(date, locations)
+
+def load_occupancy_dates(dates, locations=None):
+    """{date: {location: occupancy bitmap}} for all of the dates, raising QueryError if one was not downloaded"""
+    if _snapshot_cache is not None:
+        return {date: load_occupancy(date) for date in dates}
+
+    try:
+        conn = store.connect()
+        occupancy = store.load_occupancy_dates(conn, dates, locations)
+        conn.close()
+    except:
+        occupancy = {}
+
+    for date in dates:
+        if date not in occupancy:
+            occupancy[date] = _load_occupancy(date, locations)
+
+    return occupancy
+
+@profiling.timed("refresh free now")
+def refresh_free_now(conn, date, minute):
+    """
+    Rebuilds the rows of the free_now table (see store.FREE_NOW_DB) that are not valid at `minute`
+    of the date, which after the first call is only the rooms whose free window just ended or all of
+    them after an update. Returns the number of rows rebuilt, or None if the date was not downloaded.
+    """
+    try:
+        source = os.path.getmtime(store.EVENTS_DB)
+    except OSError:
+        return None
+
+    stale = store.stale_free_now(conn, date, minute, source)
+    if stale is not None and len(stale) == 0:
+        return 0
+
+    try:
+        intervals = load_free_intervals(date, stale)
+        events = load_events(date, stale)
+    except QueryError:
+        return None
+
+    if stale is not None:
+        # The daemon loads whole dates
+        intervals = {x: intervals[x] for x in stale if x in intervals}
+
+    rows = store.free_now_rows(minute, intervals, events)
+    store.save_free_now(conn, date, source, rows, replace=stale is None)
+    return len(rows)
+
+def dates_in_range(from_date, to_date, weekdays=None):
+    """
+    Dates (YYYY-MM-DD) from `from_date` to `to_date` inclusive, keeping only the given weekdays
+    (0 = Monday) if `weekdays` is given
+    """
+    out = []
+    date = datetime.strptime(from_date, "%Y-%m-%d")
+    end = datetime.strptime(to_date, "%Y-%m-%d")
+    while date <= end:
+        if weekdays is None or date.weekday() in weekdays:
+            out.append(date.strftime("%Y-%m-%d"))
+        date += timedelta(days=1)
+    return out
 
 def get_spaces(spaces, category, min_capacity, filter, require_25live, fav_only):
     if len(spaces) == 0:
-        click.echo("Spaces not downloaded. Run `update` command to download.", err=True)
-        sys.exit(1)
+        raise QueryError("Spaces not downloaded. Run `update` command to download.")
 
     cat = category.split(",")
 
@@ -31,8 +260,7 @@ def get_spaces(spaces, category, min_capacity, filter, require_25live, fav_only)
         cat_spaces = [space for space in spaces if space["category"] in cat]
 
     if len(cat_spaces) == 0:
-        click.echo("Invalid category or no spaces found", err=True)
-        sys.exit(1)
+        raise QueryError("Invalid category or no spaces found")
 
     cat_spaces = [x for x in cat_spaces if (x["capacity"] is None or x["capacity"] < 1 or x["capacity"] >= min_capacity)]
 
@@ -43,11 +271,11 @@ def get_spaces(spaces, category, min_capacity, filter, require_25live, fav_only)
     cat_spaces = [x for x in cat_spaces if (not fav_only) or x["location"] in FAVORITES]
 
     if len(cat_spaces) == 0:
-        click.echo("No spaces found with given capacity and filter keywords", err=True)
-        sys.exit(1)
+        raise QueryError("No spaces found with given capacity and filter keywords")
 
     return cat_spaces
 
+@profiling.timed("render table")
 def print_table(header, rows):
     if len(rows) == 0:
         click.secho("No results found", fg="red", bold=True)
@@ -77,6 +305,37 @@ def print_table(header, rows):
         for row in rows:
             click.echo(" | ".join(row))
 
+# Output formats of the query commands; everything but "table" is unstyled and streamed record by record
+OUTPUT_FORMATS = ["table", "json", "csv", "tsv"]
+
+@profiling.timed("write records")
+def write_records(format, fields, records):
+    """Writes dicts to stdout as a JSON array, CSV or TSV, keeping only `fields`"""
+    out = sys.stdout
+    if format == "json":
+        import json
+        out.write("[")
+        for i, x in enumerate(records):
+            out.write(("," if i > 0 else "") + "\n" + json.dumps({k: x[k] for k in fields}))
+        out.write("\n]\n")
+    else:
+        import csv
+        writer = csv.writer(out, delimiter="\t" if format == "tsv" else ",", lineterminator="\n")
+        writer.writerow(fields)
+        for x in records:
+            writer.writerow([_csv_value(x[k]) for k in fields])
+
+def _csv_value(x):
+    if x is None:
+        return ""
+    if isinstance(x, list):
+        return " ".join(str(a) for a in x)
+    return x
+
+def format_minutes(minutes):
+    """Minutes after midnight as HH:MM (24:00 for the end of the day)"""
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
 def format_time_delta(start, end):
     delta = end - start
 
@@ -122,44 +381,34 @@ def parse_hours_delta(delta_str):
     click.echo(f"Invalid number of hours '{delta_str}'", err=True)
     sys.exit(1)
 
-def events_to_blocks(date, events):
-    blocks = []
-    events = sorted(events, key=lambda x: x["start"])
-
-    y = date.year
-    m = date.month
-    d = date.day
-
-    if len(events) == 0:
-        return [{"start": datetime(y, m, d, 0, 0), "end": datetime(y, m, d, 23, 59), "available": True}]
-
-    if len(events) > 0 and events[0]["start"].day != events[0]["end"].day:
-        events[0]["start"] = datetime(events[0]["end"].year, events[0]["end"].month, events[0]["end"].day, 0, 0)
-
-    if len(events) > 0 and events[-1]["start"].day != events[-1]["end"].day:
-        events[-1]["end"] = datetime(events[-1]["start"].year, events[-1]["start"].month, events[-1]["start"].day, 23, 59)
-
+@profiling.timed("events_to_blocks")
+def events_to_blocks(events):
+    """
+    Splits a room's day into store.Blocks, one per event (sorted by start time, clipped to the day
+    and cut short where the next one starts) and one for each free stretch between them. The day
+    ends at 23:59.
+    """
+    day_end = store.MINUTES_PER_DAY - 1
+    events = sorted(events, key=lambda x: x.start)
 
-    # Ensure all events are on the same day
-    assert len(set(x["start"].year for x in events)) == 1
-    assert len(set(x["start"].month for x in events)) == 1
-    assert len(set(x["start"].day for x in events)) == 1
+    blocks = []
+    cur_time = 0
+    for x in events:
+        start = max(x.start, 0)
+        end = min(x.end, day_end)
 
-    cur_time = (0, 0)
-    while len(events) > 0:
-        if (events[0]["start"].hour, events[0]["start"].minute) > cur_time:
-            blocks.append({"start": datetime(y, m, d, *cur_time), "end": events[0]["start"], "available": True})
+        if start > cur_time:
+            blocks.append(store.Block(cur_time, start, True))
 
-        blocks.append({**events[0], "available": False})
-        cur_time = (events[0]["end"].hour, events[0]["end"].minute)
-        events = events[1:]
+        blocks.append(store.Block(start, end, False, x))
+        cur_time = end
 
-    if cur_time != (23, 59):
-        blocks.append({"start": datetime(y, m, d, *cur_time), "end": datetime(y, m, d, 23, 59), "available": True})
+    if cur_time != day_end:
+        blocks.append(store.Block(cur_time, day_end, True))
 
     for i in range(len(blocks) - 1):
-        if blocks[i+1]["start"] < blocks[i]["end"]:
-            blocks[i]["end"] = blocks[i+1]["start"]
+        if blocks[i+1].start < blocks[i].end:
+            blocks[i].end = blocks[i+1].start
 
     return blocks
 
@@ -175,43 +424,222 @@ def shorten(string, length):
         string = string[:length-3] + "..."
     return string
 
-def find_available_rooms(rooms, date, start_time, end_time, not_avail_time, verbose, sort_by_avail):
-    all_cats = set(x["category"] for x in rooms)
-    include_cat = len(all_cats) > 1
+def query_rooms(category="default", min_capacity=0, filter="", require_full=False, favorite=False):
+    spaces = load_spaces()
+    sp = get_spaces(spaces, category, min_capacity, filter, require_full, favorite)
+    positions = {id(x): i for i, x in enumerate(spaces)}
+    return [dict(x, index=positions[id(x)]) for x in sp]
+
+def query_room(location, date):
+    room = find_space(location)
+
+    # Rooms added to 25Live after the date was downloaded have nothing stored for it
+    events = [x.to_dict() for x in load_events(date, [room["location"]]).get(room["location"], [])]
+
+    return {"room": room, "events": events}
 
-    events_all = load_events(date)
-    blocks_all = [(room, events_to_blocks(dateutil.parser.parse(date), events_all[room["location"]])) for room in rooms]
+def query_available(date, start, end, now=None, verbose=False, category="default", min_capacity=0, filter="",
+                    require_full=False, favorite=False):
+    """
+    Rooms free from minute `start` to `end` of the date (and, if `now` is given, busy at minute `now`),
+    along with the free interval [free_from, free_until) containing `start` and the name of the event
+    that ends at free_from (if `verbose`). Also returns the categories of all rooms considered.
+    """
+    rooms = get_spaces(load_spaces(), category, min_capacity, filter, require_full, favorite)
+
+    locations = [room["location"] for room in rooms]
+    free = load_free_intervals(date, locations)
+    events_all = load_events(date, locations) if verbose else None
 
     avail = []
-    for room, blocks in blocks_all:
-        time_block = None
-        now_block = None
-        time_block_prev = None
-        prev = None
-        for block in blocks:
-            if start_time >= block["start"] and start_time <= block["end"]:
-                assert time_block is None or time_block["end"] == block["start"]
-                time_block = block
-                time_block_prev = prev
+    for room in rooms:
+        # Skip rooms added after the date was downloaded, like query_available_now does
+        intervals = free.get(room["location"])
+        if intervals is None:
+            continue
+
+        interval = store.find_free_interval(intervals, start)
+        if interval is None or interval[1] < end:
+            continue
+
+        if now is not None and store.find_free_interval(intervals, now) is not None:
+            continue
+
+        free_from, free_until = interval
+
+        previous = "None"
+        if events_all is not None:
+            prev_events = [x for x in events_all.get(room["location"], []) if min(x.end, store.MINUTES_PER_DAY) == free_from]
+            if free_from > 0 and len(prev_events) > 0:
+                previous = prev_events[-1].name
+
+        avail.append(dict(room, free_from=free_from, free_until=free_until, previous=previous))
+
+    return {"categories": sorted(set(x["category"] for x in rooms)), "rooms": avail}
+
+def query_available_now(date, start, end, verbose=False, category="default", min_capacity=0, filter="",
+                        require_full=False, favorite=False):
+    """
+    query_available() without `now`, answered with a single read of the free_now table. Meant for
+    `start` being the current minute, at which the table is normally already up to date.
+    """
+    try:
+        conn = store.connect(store.FREE_NOW_DB, store.FREE_NOW_SCHEMA)
+        rows = store.load_free_now(conn, date, start, end) if refresh_free_now(conn, date, start) is not None else None
+        conn.close()
+    except:
+        rows = None
+
+    if rows is None:
+        return query_available(date, start, end, None, verbose, category, min_capacity, filter, require_full, favorite)
 
-            if not_avail_time is not None and not_avail_time >= block["start"] and not_avail_time <= block["end"]:
-                assert now_block is None or now_block["end"] == block["start"]
-                now_block = block
+    rooms = get_spaces(load_spaces(), category, min_capacity, filter, require_full, favorite)
 
-            prev = block
+    by_location = {}
+    for room in rooms:
+        by_location.setdefault(room["location"], []).append(room)
+
+    avail = []
+    for location, free_from, free_until, previous in rows:
+        for room in by_location.get(location, []):
+            avail.append(dict(room, free_from=free_from, free_until=free_until,
+                              previous=previous if verbose and previous is not None else "None"))
 
-        prev = time_block_prev
+    return {"categories": sorted(set(x["category"] for x in rooms)), "rooms": avail}
 
-        assert not_avail_time is None or now_block is not None
-        assert time_block is not None
+def query_available_recurring(dates, start, end, min_dates=None, category="default", min_capacity=0, filter="",
+                              require_full=False, favorite=False):
+    """
+    Rooms free from minute `start` to `end` on at least `min_dates` of the dates (all of them by
+    default), each with the list of dates it is free on. Rooms free on more dates come first.
+    """
+    if len(dates) == 0:
+        raise QueryError("No dates to search")
 
-        if prev is None:
-            prev = {"end": time_block["start"], "name": "None"}
+    rooms = get_spaces(load_spaces(), category, min_capacity, filter, require_full, favorite)
+    occupancy = load_occupancy_dates(dates, [room["location"] for room in rooms])
 
-        if (not_avail_time is None or not now_block["available"]) and end_time <= time_block["end"] and time_block["available"]:
-            avail.append((room, prev, time_block))
+    if min_dates is None:
+        min_dates = len(dates)
 
-    avail = sorted(avail, key=lambda x: ("A" if x[0]["location"] in FAVORITES else "B") + (x[1]['end'].strftime('%I:%M%p') + "{:010d}".format(int(1e8) - (x[2]["end"] - x[1]["end"]).seconds) if sort_by_avail else "") + x[0]["location"])
+    mask = store.range_mask(start, max(end, start + 1))
+    days = [(date, occupancy[date]) for date in dates]
+
+    avail = []
+    for room in rooms:
+        location = room["location"]
+        # Rooms with nothing stored for a date (e.g. added after it was downloaded) aren't free on it
+        free_dates = [date for date, bits in days if location in bits and not bits[location] & mask]
+        if len(free_dates) >= min_dates:
+            avail.append(dict(room, free_dates=free_dates))
+
+    avail.sort(key=lambda x: -len(x["free_dates"]))
+    return {"dates": list(dates), "categories": sorted(set(x["category"] for x in rooms)), "rooms": avail}
+
+def building_of(location):
+    return location.split(" ")[0]
+
+def query_stats(dates, start, end, bucket=60, by="room", category="default", min_capacity=0, filter="",
+                require_full=False, favorite=False):
+    """
+    Occupancy of rooms (or of buildings, with by="building") from minute `start` to `end` over the
+    dates, as the fraction of that time they were busy, overall ("used") and per `bucket` minutes
+    ("histogram", starting at the minutes in "buckets"). Dates are read one at a time into per-minute
+    counts, so memory does not grow with the number of dates. Dates not downloaded are skipped, and
+    each room is measured over the dates it has data for ("days").
+    """
+    import numpy as np
+
+    if len(dates) == 0:
+        raise QueryError("No dates to search")
+
+    rooms = get_spaces(load_spaces(), category, min_capacity, filter, require_full, favorite)
+    locations = sorted(set(room["location"] for room in rooms))
+
+    busy = np.zeros((len(locations), end - start), dtype=np.int32)
+    days = np.zeros(len(locations), dtype=np.int64)
+    found, missing = [], []
+    for date in dates:
+        try:
+            # Uncached, unlike load_occupancy(), which would keep every date in the daemon's memory
+            occupancy = _load_occupancy(date, locations)
+        except QueryError:
+            missing.append(date)
+            continue
+
+        data = b"".join(occupancy.get(x, 0).to_bytes(store.MINUTES_PER_DAY // 8, "little") for x in locations)
+        bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8).reshape(len(locations), -1), axis=1, bitorder="little")
+        busy += bits[:, start:end]
+        # Rooms added after the date was downloaded have no row for it, rather than a free day
+        days += [x in occupancy for x in locations]
+        found.append(date)
+
+    if len(found) == 0:
+        raise QueryError(f"Events not downloaded for any date from '{dates[0]}' to '{dates[-1]}'. Run `update --from --to` to download.")
+
+    keys = sorted(set(building_of(x) for x in locations)) if by == "building" else locations
+    position = {x: i for i, x in enumerate(keys)}
+    group = [position[building_of(x) if by == "building" else x] for x in locations]
+
+    totals = np.zeros((len(keys), end - start), dtype=np.int64)
+    np.add.at(totals, group, busy)
+    room_counts = np.bincount(group, minlength=len(keys))
+    room_days = np.bincount(group, weights=days, minlength=len(keys))
+    key_days = np.zeros(len(keys), dtype=np.int64)
+    np.maximum.at(key_days, group, days)
+
+    buckets = list(range(start, end, bucket))
+    lengths = np.diff(buckets + [end])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        histogram = np.add.reduceat(totals, [x - start for x in buckets], axis=1) / (room_days[:, None] * lengths)
+        used = totals.sum(axis=1) / (room_days * (end - start))
+
+    first_room = {}
+    for room in rooms:
+        first_room.setdefault(room["location"], room)
+
+    out = []
+    for i, key in enumerate(keys):
+        if room_days[i] == 0:
+            continue
+
+        stats = {"days": int(key_days[i]), "used": round(float(used[i]), 4), "histogram": [round(float(x), 4) for x in histogram[i]]}
+        if by == "building":
+            out.append(dict(stats, building=key, rooms=int(room_counts[i])))
+        else:
+            out.append(dict(first_room[key], **stats))
+
+    return {"dates": found, "missing": missing, "buckets": buckets, "categories": sorted(set(x["category"] for x in rooms)), "rows": out}
+
+# Queries that can be answered by the daemon, see daemon.py
+QUERIES = {
+    "rooms": query_rooms,
+    "room": query_room,
+    "available": query_available,
+    "available_now": query_available_now,
+    "available_recurring": query_available_recurring,
+    "stats": query_stats
+}
+
+def available_sort_key(sort_by_avail):
+    """Favorites first, then (if `sort_by_avail`) the earliest and longest availability, then location"""
+    return lambda x: (x["location"] not in FAVORITES,
+                      (x["free_from"], x["free_from"] - x["free_until"]) if sort_by_avail else (),
+                      x["location"])
+
+def write_available_rooms(result, format, verbose, sort_by_avail):
+    rooms = sorted(result["rooms"], key=available_sort_key(sort_by_avail))
+    fields = ["location", "category", "capacity", "25live_id", "free_from", "free_until"] + (["previous"] if verbose else [])
+    write_records(format, fields, (dict(x, free_from=format_minutes(x["free_from"]), free_until=format_minutes(x["free_until"]),
+                                        previous=None if x["previous"] == "None" else x["previous"]) for x in rooms))
+
+def print_available_rooms(result, date, verbose, sort_by_avail):
+    include_cat = len(result["categories"]) > 1
+
+    # Blocks end at 23:59 rather than midnight
+    avail = [(x, {"end": store.from_minutes(date, x["free_from"]), "name": x["previous"]},
+              {"end": store.from_minutes(date, min(x["free_until"], store.MINUTES_PER_DAY - 1))})
+             for x in sorted(result["rooms"], key=available_sort_key(sort_by_avail))]
 
     header = ["Location", "Category", "Capacity", "Available"] + (["Previous Event"] if verbose else [])
 
@@ -227,3 +655,65 @@ def find_available_rooms(rooms, date, start_time, end_time, not_avail_time, verb
         rows = [row[0:1] + row[2:] for row in rows]
 
     print_table(header, rows)
+
+def print_recurring_rooms(result):
+    include_cat = len(result["categories"]) > 1
+    dates = result["dates"]
+
+    header = ["Location", "Category", "Capacity", "Free", "Busy On"]
+
+    rows = [(click.style(x["location"], bold=x["location"] in FAVORITES,
+                fg="green" if x["location"] in FAVORITES else "red" if x["25live_id"] is None else "white"),
+             x["category"],
+             str(x["capacity"]) if x["capacity"] != 0 else "?",
+             f"{len(x['free_dates'])}/{len(dates)}",
+             shorten(", ".join(datetime.strptime(d, "%Y-%m-%d").strftime("%a %m/%d") for d in dates if d not in x["free_dates"]), 40))
+            for x in result["rooms"]]
+
+    if not include_cat:
+        header = header[0:1] + header[2:]
+        rows = [row[0:1] + row[2:] for row in rows]
+
+    print_table(header, rows)
+
+def write_recurring_rooms(result, format):
+    write_records(format, ["location", "category", "capacity", "25live_id", "free_dates"], result["rooms"])
+
+HISTOGRAM_CHARS = " ▁▂▃▄▅▆▇█"
+
+def stats_sort_key(sort_by_used):
+    return lambda x: (x["used"] if sort_by_used else 0, x.get("building") or x["location"])
+
+def print_stats(result, by, start, end, bucket, sort_by_used):
+    include_cat = by == "room" and len(result["categories"]) > 1
+    hours = f"{format_minutes(start)}-{format_minutes(end)}"
+
+    if by == "building":
+        header = ["Building", "Rooms", "Used", f"Busy {hours}"]
+        rows = [(x["building"], str(x["rooms"]), f"{x['used'] * 100:.0f}%",
+                 "".join(HISTOGRAM_CHARS[round(h * 8)] for h in x["histogram"]))
+                for x in sorted(result["rows"], key=stats_sort_key(sort_by_used))]
+    else:
+        header = ["Location", "Category", "Capacity", "Used", f"Busy {hours}"]
+        rows = [(click.style(x["location"], bold=x["location"] in FAVORITES,
+                    fg="green" if x["location"] in FAVORITES else "red" if x["25live_id"] is None else "white"),
+                 x["category"],
+                 str(x["capacity"]) if x["capacity"] != 0 else "?",
+                 f"{x['used'] * 100:.0f}%",
+                 "".join(HISTOGRAM_CHARS[round(h * 8)] for h in x["histogram"]))
+                for x in sorted(result["rows"], key=stats_sort_key(sort_by_used))]
+
+        if not include_cat:
+            header = header[0:1] + header[2:]
+            rows = [row[0:1] + row[2:] for row in rows]
+
+    dates = result["dates"]
+    click.echo(f"Occupancy over {len(dates)} days from {dates[0]} to {dates[-1]} ({bucket} minutes per column)")
+    print_table(header, rows)
+
+def write_stats(result, format, by, sort_by_used):
+    """One record per room or building, with the fraction of each bucket it was busy in columns named by the bucket start"""
+    columns = [format_minutes(x) for x in result["buckets"]]
+    fields = (["building", "rooms"] if by == "building" else ["location", "category", "capacity", "25live_id"]) + ["days", "used"] + columns
+    write_records(format, fields, (dict(x, **dict(zip(columns, x["histogram"])))
+                                   for x in sorted(result["rows"], key=stats_sort_key(sort_by_used))))